@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Benchmarks for dlab, in the format used by airspeed velocity (asv)
+
+All the data are synthetic and generated when the benchmarks are set up, so
+the suite does not need any recordings or network access. To time the
+current checkout using the packages already installed in the environment:
+
+    pip install -e .
+    asv run --python=same
+
+To compare two commits (this builds dlab in separate environments):
+
+    asv continuous master HEAD
+
+"""
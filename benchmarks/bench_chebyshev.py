@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Benchmarks for fitting exponentials"""
+from dlab import chebyshev
+
+from .synthetic import exponential_traces
+
+
+class FitExponentials:
+    params = ([100, 10000], [1000], [1, 2])
+    param_names = ["n_traces", "n_samples", "n_exps"]
+
+    def setup(self, n_traces, n_samples, n_exps):
+        self.data = exponential_traces(n_traces, n_samples)
+
+    def time_fit_exponentials(self, n_traces, n_samples, n_exps):
+        chebyshev.fit_exponentials(self.data, n_exps, n_coef=12, dt=1e-4)
+
+    def time_fit_exponentials_nofit(self, n_traces, n_samples, n_exps):
+        chebyshev.fit_exponentials(self.data, n_exps, n_coef=12, dt=1e-4, fitted=False)
+
+    def time_fit_exponentials_threads(self, n_traces, n_samples, n_exps):
+        chebyshev.fit_exponentials(self.data, n_exps, n_coef=12, dt=1e-4, jobs=4)
+
+
+class ExponentialFitter:
+    params = [100, 10000]
+    param_names = ["n_traces"]
+
+    def setup(self, n_traces):
+        self.data = exponential_traces(n_traces, 1000)
+
+    def time_sweep_n_exps(self, n_traces):
+        fitter = chebyshev.ExponentialFitter(n_coef=12, dt=1e-4)
+        for n_exps in (1, 2, 3):
+            fitter.fit(self.data, n_exps, fitted=False)
+
+
+class FitWindows:
+    params = [10 ** 6, 10 ** 7]
+    param_names = ["n_samples"]
+    timeout = 300
+
+    def setup(self, n_samples):
+        self.data = exponential_traces(1, n_samples)[0]
+
+    def time_fit_windows(self, n_samples):
+        for table in chebyshev.fit_windows(self.data, 1000, 500, 1, n_coef=12, dt=1e-4):
+            pass
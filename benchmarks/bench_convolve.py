@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Benchmarks for convolving spike trains with a kernel"""
+import numpy as np
+
+from dlab import convolve
+
+from .synthetic import spike_trains
+
+
+class DiscreteConv:
+    params = ([100, 1000], [10.0, 100.0], [0.05, 0.5], ["direct", "fft", "auto"])
+    param_names = ["n_trains", "rate", "kernel_duration", "method"]
+    duration = 5.0
+    kdt = 0.001
+    odt = 0.001
+
+    def setup(self, n_trains, rate, kernel_duration, method):
+        self.events, self.offsets = spike_trains(n_trains, rate, self.duration)
+        lags = np.arange(0, kernel_duration, self.kdt)
+        self.kernel = np.exp(-lags / (kernel_duration / 5))
+        self.out = np.empty((n_trains, convolve.grid_size(0, self.duration, self.odt)))
+
+    def time_discreteconv_batch(self, n_trains, rate, kernel_duration, method):
+        convolve.discreteconv_batch(
+            self.events, self.offsets, self.kernel, self.kdt, 0, self.duration, self.odt,
+            out=self.out, method=method,
+        )
+
+    def time_discreteconv_loop(self, n_trains, rate, kernel_duration, method):
+        for i in range(n_trains):
+            convolve.discreteconv(
+                self.events[self.offsets[i]:self.offsets[i + 1]], self.kernel, self.kdt,
+                0, self.duration, self.odt, method=method,
+            )
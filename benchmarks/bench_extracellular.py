@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Benchmarks for trial extraction from ARF recordings"""
+import h5py
+
+from dlab import extracellular
+from dlab.synthetic import write_audiolog, write_oeaudio
+
+
+class OEAudioTrials:
+    params = [10, 100, 1000]
+    param_names = ["n_trials"]
+    timeout = 300
+
+    def setup_cache(self):
+        for n_trials in self.params:
+            write_oeaudio(
+                "oeaudio_%d.arf" % n_trials, n_entries=2, n_trials=n_trials, n_channels=0, seed=1
+            )
+
+    def setup(self, n_trials):
+        self.fp = h5py.File("oeaudio_%d.arf" % n_trials, "r")
+
+    def teardown(self, n_trials):
+        self.fp.close()
+
+    def time_scan_entries(self, n_trials):
+        extracellular.scan_entries(self.fp)
+
+    def time_oeaudio_to_trials(self, n_trials):
+        list(extracellular.oeaudio_to_trials(self.fp, sync_dset="sync"))
+
+    def time_oeaudio_to_trials_chunked(self, n_trials):
+        list(extracellular.oeaudio_to_trials(self.fp, sync_dset="sync", chunk_size=1 << 20))
+
+    def time_oeaudio_to_trials_nosync(self, n_trials):
+        list(extracellular.oeaudio_to_trials(self.fp))
+
+
+class AudiologTrials:
+    params = ([10, 100], [1, 4])
+    param_names = ["n_trials", "jobs"]
+    timeout = 300
+
+    def setup_cache(self):
+        return {
+            n_trials: write_audiolog("audiolog_%d.arf" % n_trials, n_trials, n_channels=0, seed=2)
+            for n_trials in self.params[0]
+        }
+
+    def setup(self, trials, n_trials, jobs):
+        self.trials = trials[n_trials]
+        self.fp = h5py.File("audiolog_%d.arf" % n_trials, "r")
+
+    def teardown(self, trials, n_trials, jobs):
+        self.fp.close()
+
+    def time_audiolog_to_trials(self, trials, n_trials, jobs):
+        list(extracellular.audiolog_to_trials(self.trials, self.fp, jobs=jobs))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Benchmarks for grouping mountainsort spikes into trials"""
+from dlab import mountain, pprox
+
+from .synthetic import firings, trials_pprox, write_firings
+
+
+class AssignEvents:
+    params = ([100, 1000], [10 ** 5, 10 ** 6])
+    param_names = ["n_trials", "n_events"]
+    timeout = 300
+
+    def setup_cache(self):
+        for n_trials in self.params[0]:
+            obj = trials_pprox(n_trials)
+            for n_events in self.params[1]:
+                write_firings("firings_%d_%d.mda" % (n_trials, n_events), firings(obj, n_events))
+
+    def setup(self, n_trials, n_events):
+        self.path = "firings_%d_%d.mda" % (n_trials, n_events)
+        self.pprox = trials_pprox(n_trials)
+        self.array_pprox = pprox.ArrayPprox.from_pprox(self.pprox)
+        self.events = next(mountain.read_firings(self.path))
+
+    def time_assign_events(self, n_trials, n_events):
+        mountain.assign_events(self.pprox, self.events)
+
+    def time_assign_events_array(self, n_trials, n_events):
+        mountain.assign_events(self.array_pprox, self.events)
+
+    def time_assign_event_chunks(self, n_trials, n_events):
+        mountain.assign_event_chunks(self.pprox, mountain.read_firings(self.path, 100000))
+
+    def peakmem_assign_event_chunks(self, n_trials, n_events):
+        mountain.assign_event_chunks(self.pprox, mountain.read_firings(self.path, 100000))
+
+
+class AggregateEvents:
+    params = ([100, 1000], [10 ** 5, 10 ** 6])
+    param_names = ["n_trials", "n_events"]
+    timeout = 300
+
+    def setup(self, n_trials, n_events):
+        obj = trials_pprox(n_trials)
+        clusters = mountain.assign_events(obj, firings(obj, n_events, n_clusters=1))
+        self.pprox = next(iter(clusters.values()))
+        self.array_pprox = pprox.ArrayPprox.from_pprox(self.pprox)
+
+    def time_aggregate_events(self, n_trials, n_events):
+        mountain.aggregate_events(self.pprox)
+
+    def time_aggregate_events_array(self, n_trials, n_events):
+        mountain.aggregate_events(self.array_pprox)
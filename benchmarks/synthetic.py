@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Generate synthetic data for the benchmarks"""
+import numpy as np
+
+sampling_rate = 30000
+
+
+def trials_pprox(n_trials, seed=3):
+    """Returns a pprox object with empty trials that tile a continuous recording"""
+    from dlab import pprox
+
+    rng = np.random.default_rng(seed)
+    bounds = np.cumsum(rng.integers(sampling_rate, 3 * sampling_rate, n_trials + 1))
+    trials = [
+        {
+            "events": [],
+            "index": i,
+            "stim": "stim%d" % (i % 10),
+            "offset": float(bounds[i]) / sampling_rate,
+            "recording": {
+                "entry": 0,
+                "start": int(bounds[i]),
+                "stop": int(bounds[i + 1]),
+                "sampling_rate": sampling_rate,
+            },
+        }
+        for i in range(n_trials)
+    ]
+    return pprox.from_trials(trials, recording="synthetic")
+
+
+def firings(obj, n_events, n_clusters=30, seed=4):
+    """Returns an (n_events, 3) array of (channel, sample, cluster), sorted by time"""
+    rng = np.random.default_rng(seed)
+    first = obj["pprox"][0]["recording"]["start"]
+    last = obj["pprox"][-1]["recording"]["stop"]
+    times = np.sort(rng.integers(first, last, n_events))
+    clusters = rng.integers(1, n_clusters + 1, n_events)
+    return np.column_stack([clusters % 4 + 1, times, clusters]).astype("d")
+
+
+def write_firings(path, events):
+    """Writes events to an mda file, like the firings.mda output of mountainsort"""
+    from arfx import mdaio
+
+    with mdaio.mdafile(path, "w") as fp:
+        fp.write(np.ascontiguousarray(events, dtype="float64"))
+
+
+def exponential_traces(n_traces, n_samples, dt=1e-4, seed=5):
+    """Returns noisy traces with single exponential decays, shape (n_traces, n_samples)"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) * dt
+    tau = rng.uniform(20, 200, (n_traces, 1)) * dt
+    return 1.0 + 2.0 * np.exp(-t / tau) + rng.normal(0, 0.01, (n_traces, n_samples))
+
+
+def spike_trains(n_trains, rate, duration, seed=6):
+    """Returns (events, offsets) for Poisson spike trains"""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(rate * duration, n_trains)
+    offsets = np.zeros(n_trains + 1, dtype="i8")
+    np.cumsum(counts, out=offsets[1:])
+    events = np.concatenate([np.sort(rng.uniform(0, duration, n)) for n in counts])
+    return events, offsets
@@ -62,11 +62,66 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import functools
+
 from dlab._chebyshev import forward_transform, inverse_transform, polynomials
 from dlab._chebyshev import normalization_factors, polynomial_roots
 
 
-def fit_exponentials(data, n_exps, n_coef=6, dt=1.0, axis=-1):
+@functools.lru_cache(maxsize=32)
+def _polynomial_table(numdata, numcoef):
+    """Returns the normalized Chebyshev polynomials, shape (numcoef, numdata)"""
+    table = polynomials(numdata, numcoef, norm=True)
+    table.setflags(write=False)
+    return table
+
+
+def _exp_params(params, n_exps):
+    return {
+        "offset": params[..., 0],
+        "amplitude": params[..., 1:(1 + n_exps)],
+        "lifetime": params[..., (1 + n_exps):(1 + 2 * n_exps)]
+    }
+
+
+def _fit_parallel(func, data, axis, jobs, *args, coef=None, **kwargs):
+    """Calls func on blocks of traces in separate threads
+
+    func is one of the fitting functions in the _chebyshev module, which
+    release the GIL while fitting each trace. The traces (i.e., all the axes
+    of data except for axis) are split into jobs blocks, along with coef if it
+    is not None. Returns the concatenated (params, fitted) arrays, with the
+    same shapes as func would return for the whole array.
+    """
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+
+    data = np.moveaxis(np.asarray(data, dtype="d"), axis, -1)
+    shape = data.shape
+    traces = data.reshape(-1, shape[-1])
+    if coef is not None:
+        coef = coef.reshape(traces.shape[0], -1)
+
+    def fit(start, stop):
+        if coef is None:
+            return func(traces[start:stop], *args, axis=-1, **kwargs)
+        return func(traces[start:stop], *args, axis=-1, coef=coef[start:stop], **kwargs)
+
+    if jobs <= 1 or traces.shape[0] <= 1:
+        params, fitted = fit(0, traces.shape[0])
+    else:
+        bounds = np.linspace(0, traces.shape[0], min(jobs, traces.shape[0]) + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(fit, bounds[:-1], bounds[1:]))
+        params = np.concatenate([p for p, _ in results])
+        fitted = None if results[0][1] is None else np.concatenate([f for _, f in results])
+    params = params.reshape(shape[:-1] + params.shape[-1:])
+    if fitted is not None:
+        fitted = np.moveaxis(fitted.reshape(shape), -1, axis)
+    return params, fitted
+
+
+def fit_exponentials(data, n_exps, n_coef=6, dt=1.0, axis=-1, jobs=1, fitted=True):
     """Fit data to a sum of one or more exponential functions
 
     Parameters
@@ -81,27 +136,186 @@ def fit_exponentials(data, n_exps, n_coef=6, dt=1.0, axis=-1):
          The sampling rate of the data. Used to scale the returned time constant(s)
     axis : int
          If data.dim is > 1, specify the time dimension
+    jobs : int
+         If > 1, the traces are split across this many threads
+    fitted : bool
+         If False, the fitted data are not calculated
 
     Returns
     -------
         dict
            {offset, amplitude, lifetime}
         array
-           The fitted data
+           The fitted data, or None if fitted is False
+
+    """
+    from dlab._chebyshev import fitexps
+    if jobs > 1:
+        params, fitted = _fit_parallel(
+            fitexps, data, axis, jobs, n_exps, n_coef, deltat=dt, fitted=fitted)
+    else:
+        params, fitted = fitexps(data, n_exps, n_coef, deltat=dt, axis=axis, fitted=fitted)
+    return _exp_params(params, n_exps), fitted
+
+
+class ExponentialFitter(object):
+    """Fit data to sums of exponentials, reusing work across calls
+
+    Use this instead of fit_exponentials when fitting the same data several
+    times (e.g., to compare different numbers of exponentials). The first step
+    of the fit is a forward Chebyshev transform of each trace, which does not
+    depend on n_exps. The fitter keeps the transforms of the last `maxsize`
+    arrays it has seen, keyed on the identity of the array, so they are only
+    computed once. The normalized polynomial tables are cached for each
+    combination of trace length and number of coefficients.
+
+    Inputs that are not float64 arrays are converted once, and the converted
+    copy is cached along with the transforms. If the data are modified in
+    place after they have been fit, call `clear()` before fitting them again.
+
+    >>> fitter = ExponentialFitter(n_coef=12, dt=1e-4)
+    >>> fits = [fitter.fit(data, n) for n in (1, 2, 3)]
+
+    """
+
+    def __init__(self, n_coef=6, dt=1.0, maxsize=8):
+        self.n_coef = n_coef
+        self.dt = dt
+        self.maxsize = maxsize
+        self._transforms = {}
+
+    def clear(self):
+        """Discards the cached transforms"""
+        self._transforms.clear()
+
+    def _n_coef(self, numdata):
+        return min(self.n_coef, numdata)
+
+    def _lookup(self, data, axis):
+        """Returns data as a float64 array and its Chebyshev coefficients
+
+        The cache is keyed on the object passed by the caller, so data that
+        has to be converted (e.g., a list or a float32 array) is only
+        converted once. The converted copy is kept in the cache with the
+        coefficients.
+        """
+        import numpy as np
+
+        axis = axis % np.ndim(data)
+        key = (id(data), axis)
+        cached = self._transforms.pop(key, None)
+        if cached is None or cached[0] is not data:
+            array = np.asarray(data, dtype="d")
+            numdata = array.shape[axis]
+            table = _polynomial_table(numdata, self._n_coef(numdata))
+            coef = np.ascontiguousarray(np.moveaxis(array, axis, -1) @ table.T)
+            cached = (data, array, coef)
+        self._transforms[key] = cached
+        while len(self._transforms) > self.maxsize:
+            del self._transforms[next(iter(self._transforms))]
+        return cached[1], cached[2]
+
+    def transform(self, data, axis=-1):
+        """Returns the Chebyshev coefficients of each trace in data
+
+        The result has the shape of data with the time axis moved to the end
+        and replaced by the coefficients.
+        """
+        return self._lookup(data, axis)[1]
+
+    def fit(self, data, n_exps, axis=-1, jobs=1, fitted=True):
+        """Fit data to a sum of n_exps exponential functions
+
+        The arguments and return values are the same as for fit_exponentials.
+        """
+        from dlab._chebyshev import fitexps
+
+        data, coef = self._lookup(data, axis)
+        numdata = data.shape[axis]
+        numcoef = self._n_coef(numdata)
+        kwargs = dict(
+            deltat=self.dt,
+            fitted=fitted,
+            poly=_polynomial_table(numdata, numcoef),
+            coef=coef,
+        )
+        if jobs > 1:
+            params, fitted = _fit_parallel(fitexps, data, axis, jobs, n_exps, numcoef, **kwargs)
+        else:
+            params, fitted = fitexps(data, n_exps, numcoef, axis=axis, **kwargs)
+        return _exp_params(params, n_exps), fitted
+
+
+def fit_windows(dset, window, step, n_exps, n_coef=6, dt=None, chunk_size=1 << 20, jobs=1):
+    """Fit exponentials in sliding windows over a long 1-D dataset
+
+    Parameters
+    ----------
+    dset : 1-D array or h5py dataset
+         The data to be fit. Only chunk_size samples are read at a time.
+    window : int
+         The length of each window (samples)
+    step : int
+         The interval between the starts of successive windows (samples)
+    n_exps : int
+         The number of exponentials to fit in each window
+    n_coef : int
+         The number of coefficients used to fit the data
+    dt : float
+         The sampling interval of the data. If None, this is taken from the
+         sampling_rate attribute of the dataset, if there is one, or 1.0.
+    chunk_size : int
+         The approximate number of samples to read and fit at once
+    jobs : int
+         If > 1, the windows in each chunk are split across this many threads
+
+    Yields
+    ------
+        record array
+           {start, offset, amplitude, lifetime} for each window in a chunk,
+           with start in samples. The windows only cover complete windows
+           within the dataset.
 
     """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
     from dlab._chebyshev import fitexps
-    params, fitted = fitexps(data, n_exps, n_coef, deltat=dt, axis=axis)
-    return (
-        {
-            "offset": params[..., 0],
-            "amplitude": params[..., 1:(1 + n_exps)],
-            "lifetime": params[..., (1 + n_exps):(1 + 2 * n_exps)]
-        },
-        fitted)
+
+    if dset.ndim != 1:
+        raise ValueError("dataset must be one-dimensional")
+    if window < 1 or step < 1:
+        raise ValueError("window and step must be positive")
+    if dt is None:
+        attrs = getattr(dset, "attrs", {})
+        dt = 1.0 / attrs["sampling_rate"] if "sampling_rate" in attrs else 1.0
+    numcoef = min(n_coef, window)
+    poly = _polynomial_table(window, numcoef)
+    dtype = np.dtype([
+        ("start", "i8"),
+        ("offset", "d"),
+        ("amplitude", "d", (n_exps,)),
+        ("lifetime", "d", (n_exps,)),
+    ])
+    n_windows = max(0, (dset.shape[0] - window) // step + 1)
+    batch = max(1, (chunk_size - window) // step + 1)
+    for first in range(0, n_windows, batch):
+        count = min(batch, n_windows - first)
+        start = first * step
+        data = np.asarray(dset[start:start + (count - 1) * step + window], dtype="d")
+        traces = sliding_window_view(data, window)[::step]
+        if jobs > 1:
+            params, _ = _fit_parallel(
+                fitexps, traces, -1, jobs, n_exps, numcoef, deltat=dt, poly=poly, fitted=False)
+        else:
+            params, _ = fitexps(traces, n_exps, numcoef, deltat=dt, axis=-1, poly=poly, fitted=False)
+        table = np.empty(count, dtype=dtype)
+        table["start"] = start + np.arange(count) * step
+        for name, value in _exp_params(params, n_exps).items():
+            table[name] = value
+        yield table
 
 
-def fit_harmonic_decay(data, n_coef=6, dt=1.0, axis=-1):
+def fit_harmonic_decay(data, n_coef=6, dt=1.0, axis=-1, jobs=1, fitted=True):
     """Fit data to a harmonic exponential decay function
 
     Parameters
@@ -114,19 +328,34 @@ def fit_harmonic_decay(data, n_coef=6, dt=1.0, axis=-1):
          The sampling rate of the data. Used to scale the returned time constant(s)
     axis : int
          If data.dim is > 1, specify the time dimension
+    jobs : int
+         If > 1, the traces are split across this many threads
+    fitted : bool
+         If False, the fitted data are not calculated
 
     Returns
     -------
-        dict
-           {offset, amplitude, lifetime, frequency}
+        record array
+           {offset, lifetime, amplitude[3]} for each trace, with the shape of
+           data minus the time dimension. The fitted function is
+           offset + exp(-t / lifetime) * (a0 - a1 * sin(w * t) + a2 * cos(w * t)),
+           where amplitude = (a0, a1, a2). The frequency w is not fit; it is
+           fixed at 2 * pi / (N * dt), where N is the number of samples. The
+           record array is a view on the parameters returned by the C
+           extension, so no data are copied.
         array
-           The fitted data
+           The fitted data, or None if fitted is False
     """
+    import numpy as np
     from dlab._chebyshev import fitexpsin
-    params, fitted = fitexpsin(data, n_coef, deltat=dt, axis=axis)
-    return params, fitted
-    return ({"offset": params[..., 0],
-             "amplitude": params[..., 1:3],
-             "lifetime": params[..., 3],
-             "frequency": params[..., 4]},
-            fitted)
+    if jobs > 1:
+        params, fitted = _fit_parallel(
+            fitexpsin, data, axis, jobs, n_coef, deltat=dt, fitted=fitted)
+    else:
+        params, fitted = fitexpsin(data, n_coef, deltat=dt, axis=axis, fitted=fitted)
+    dtype = np.dtype([
+        ("offset", "d"),
+        ("lifetime", "d"),
+        ("amplitude", "d", (3,)),
+    ])
+    return np.ascontiguousarray(params).view(dtype)[..., 0], fitted
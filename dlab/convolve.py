@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Convolve spike trains with a kernel
+
+The kernel is sampled at intervals of `kdt`, starting at lag 0, so it only
+extends forward in time (i.e., it is causal). The convolution is evaluated at
+the points of a regular grid that starts at `onset` and has a spacing of
+`odt`. Events outside the interval [onset, offset] are ignored.
+
+There are two ways of computing the convolution:
+
+- "direct": for each event, the kernel is evaluated at every grid point it
+  covers, using linear interpolation between the kernel samples. This is done
+  by the `dlab._convolve` extension module, which releases the GIL, so it can
+  be run from several threads at once. The cost is proportional to the number
+  of events times the number of grid points spanned by the kernel.
+
+- "fft": the kernel is resampled on the output grid, and each event is binned
+  at the grid point to its left, with weights that interpolate between the
+  kernel at that point and at the next one. The binned trains are convolved
+  with the resampled kernel using the FFT. The cost is proportional to the
+  number of trains times the length of the grid (times its log), regardless of
+  the number of events.
+
+The two methods agree to within rounding error (about 1e-12 relative to the
+largest output value) when `kdt` is an integer multiple of `odt`. Otherwise,
+the FFT method interpolates linearly between the kernel values at the grid
+points, and the contribution of each event to a grid point can differ by up to
+`max(abs(diff(append(kernel, [0, 0]), 2))) * r * ceil(r) / 4`, where
+`r = odt / kdt`. The kernel is padded with zeros because it falls to zero
+after its last sample.
+
+With `method="auto"` (the default), the method that is expected to be faster
+is chosen from the number of events, the length of the kernel, and the length
+of the grid.
+
+"""
+import numpy as np
+
+from dlab import _convolve
+
+# relative cost of one FFT operation (per point and per log2 of the length),
+# in units of one step of the direct method's inner loop
+_fft_cost = 0.5
+# the number of complex values to transform at once in the FFT method
+_fft_block = 1 << 22
+
+
+def grid_size(onset, offset, odt):
+    """Returns the number of points in the output grid from onset to offset"""
+    return int(np.ceil((offset - onset) / odt))
+
+
+def resample_kernel(kernel, kdt, odt):
+    """Samples a kernel at intervals of odt, using linear interpolation
+
+    The kernel falls linearly to zero one interval of `kdt` after its last
+    sample, as in the direct method. The returned array includes the first
+    point beyond the end of the kernel, which is always zero.
+    """
+    kernel = np.asarray(kernel, dtype="d")
+    n_kern = kernel.size
+    n_out = int(np.ceil(n_kern * kdt / odt))
+    x = np.arange(n_out + 1) * (odt / kdt)
+    return np.interp(x, np.arange(n_kern + 1), np.append(kernel, 0.0), right=0.0)
+
+
+def choose_method(n_events, n_trains, n_kern, kdt, onset, offset, odt):
+    """Returns the method ("direct" or "fft") expected to be faster"""
+    nt = grid_size(onset, offset, odt)
+    span = min(int(np.ceil(n_kern * kdt / odt)), nt)
+    n_fft = _fft_size(nt, span)
+    direct = n_events * span
+    fft = _fft_cost * n_trains * n_fft * np.log2(max(n_fft, 2))
+    return "fft" if fft < direct else "direct"
+
+
+def _fft_size(nt, n_kern):
+    return 1 << max(nt + n_kern - 2, 1).bit_length()
+
+
+def _fft_batch(events, offsets, kernel, kdt, onset, offset, odt, out):
+    """Computes the convolution of a batch of trains using the FFT"""
+    n_trains, nt = out.shape
+    kern = resample_kernel(kernel, kdt, odt)
+    n_kern = kern.size - 1
+    if n_kern == 0 or nt == 0:
+        out[:] = 0.0
+        return
+    n_fft = _fft_size(nt, n_kern)
+    # an event at grid point j plus a fraction a of the interval contributes
+    # (1 - a) * kern[m] + a * kern[m + 1] to grid point j + m
+    k_left = np.fft.rfft(kern[:-1], n_fft)
+    k_right = np.fft.rfft(kern[1:], n_fft)
+    block = max(1, _fft_block // n_fft)
+    for start in range(0, n_trains, block):
+        stop = min(start + block, n_trains)
+        times = events[offsets[start]:offsets[stop]]
+        trial = np.repeat(np.arange(stop - start), np.diff(offsets[start:stop + 1]))
+        valid = (times >= onset) & (times <= offset)
+        rel = times[valid] - onset
+        step = np.floor(rel / odt)
+        frac = (rel - odt * step) / odt
+        index = step.astype("i8")
+        keep = index < nt
+        flat = trial[valid][keep] * nt + index[keep]
+        frac = frac[keep]
+        size = (stop - start) * nt
+        right = np.bincount(flat, weights=frac, minlength=size).reshape(-1, nt)
+        left = np.bincount(flat, weights=1.0 - frac, minlength=size).reshape(-1, nt)
+        spectrum = np.fft.rfft(left, n_fft, axis=1) * k_left
+        spectrum += np.fft.rfft(right, n_fft, axis=1) * k_right
+        out[start:stop] = np.fft.irfft(spectrum, n_fft, axis=1)[:, :nt]
+
+
+def _batch(events, offsets, kernel, kdt, onset, offset, odt, out, method):
+    if method == "fft":
+        _fft_batch(events, offsets, kernel, kdt, onset, offset, odt, out)
+    else:
+        _convolve.discreteconv_batch(events, offsets, kernel, kdt, onset, offset, odt, out)
+
+
+def discreteconv(times, kernel, kdt, onset, offset, odt, method="auto"):
+    """Convolves a single spike train with a kernel
+
+    times: event times (s)
+    kernel: the kernel, sampled at intervals of kdt starting at lag 0
+    kdt: the sampling interval of the kernel (s)
+    onset, offset: the start and end of the output grid (s)
+    odt: the sampling interval of the output grid (s)
+    method: "direct", "fft", or "auto" (see module docstring)
+
+    Returns a 1-D array with `grid_size(onset, offset, odt)` values.
+    """
+    if method == "direct":
+        return _convolve.discreteconv(times, kernel, kdt, onset, offset, odt)
+    times = np.asarray(times, dtype="d")
+    offsets = np.array([0, times.size], dtype="i8")
+    return discreteconv_batch(times, offsets, kernel, kdt, onset, offset, odt, method=method)[0]
+
+
+def discreteconv_batch(
+    events, offsets, kernel, kdt, onset, offset, odt, out=None, jobs=1, method="auto"
+):
+    """Convolves a batch of spike trains with the same kernel
+
+    events: the event times of all the trains, concatenated
+    offsets: the events of train i are `events[offsets[i]:offsets[i + 1]]`
+    out: if not None, a writeable float64 array with shape (trains, grid points)
+         and contiguous rows. It is overwritten with the results.
+    jobs: the number of threads to split the trains across
+
+    The other arguments are as for `discreteconv`. Returns `out`, or a new
+    array if `out` is None.
+    """
+    if method not in ("auto", "direct", "fft"):
+        raise ValueError("method must be 'auto', 'direct', or 'fft'")
+    events = np.ascontiguousarray(events, dtype="d")
+    offsets = np.ascontiguousarray(offsets, dtype="i8")
+    kernel = np.ascontiguousarray(kernel, dtype="d")
+    n_trains = offsets.size - 1
+    nt = grid_size(onset, offset, odt)
+    if out is None:
+        out = np.empty((n_trains, nt), dtype="d")
+    if out.shape != (n_trains, nt):
+        raise ValueError(
+            "out has shape %s, expected %s" % (out.shape, (n_trains, nt))
+        )
+    if method == "auto":
+        method = choose_method(
+            offsets[-1] - offsets[0], n_trains, kernel.size, kdt, onset, offset, odt
+        )
+    if jobs <= 1 or n_trains <= 1:
+        _batch(events, offsets, kernel, kdt, onset, offset, odt, out, method)
+        return out
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    bounds = np.linspace(0, n_trains, min(jobs, n_trains) + 1).astype(int)
+
+    def run(start, stop):
+        _batch(
+            events, offsets[start:stop + 1], kernel, kdt, onset, offset, odt, out[start:stop], method
+        )
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(run, bounds[:-1], bounds[1:]):
+            pass
+    return out
+
+
+def convolve_units(objs, kernel, kdt, onset, offset, odt, out=None, jobs=1, method="auto"):
+    """Convolves all the trials of one or more units with the same kernel
+
+    objs: a pprox object, or a sequence of pprox objects (one per unit). These
+          can be in dict form, ArrayPprox objects, or streamed.
+
+    The other arguments are as for `discreteconv_batch`. Returns an array with
+    one row for each trial, with the trials of each unit in order.
+    """
+    from dlab.rates import event_arrays
+
+    if isinstance(objs, dict) or hasattr(objs, "events"):
+        objs = (objs,)
+    arrays = [event_arrays(obj) for obj in objs]
+    if not arrays:
+        events = np.empty(0, dtype="d")
+        offsets = np.zeros(1, dtype="i8")
+    else:
+        events = np.concatenate([e for e, _ in arrays])
+        starts = np.cumsum([0] + [e.size for e, _ in arrays[:-1]])
+        offsets = np.concatenate(
+            [[0]] + [o[1:] + start for (_, o), start in zip(arrays, starts)]
+        ).astype("i8")
+    return discreteconv_batch(events, offsets, kernel, kdt, onset, offset, odt, out, jobs, method)
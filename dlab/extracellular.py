@@ -20,55 +20,151 @@ def entry_time(entry):
     from arf import timestamp_to_float
     return timestamp_to_float(entry.attrs["timestamp"])
 
+
+def running_stats(dset, chunk_size):
+    """Computes the mean and standard deviation of a 1-D dataset in chunks
+
+    Only `chunk_size` samples are read into memory at a time. The statistics for
+    each chunk are combined using the pairwise update of Chan et al. (1979).
+    """
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for start in range(0, dset.shape[0], chunk_size):
+        chunk = dset[start:start + chunk_size].astype("d")
+        n = chunk.size
+        chunk_mean = chunk.mean()
+        delta = chunk_mean - mean
+        total = count + n
+        mean += delta * n / total
+        m2 += ((chunk - chunk_mean) ** 2).sum() + delta ** 2 * count * n / total
+        count = total
+    if count == 0:
+        return np.nan, np.nan
+    return mean, np.sqrt(m2 / count)
+
+
+def detect_clicks(dset, det, chunk_size=None):
+    """Detects synchronization clicks in a 1-D dataset
+
+    dset: the dataset containing the sync signal
+    det: a quickspikes detector. The threshold is scaled by the mean and standard
+         deviation of the signal.
+    chunk_size: if None, the whole dataset is loaded into memory. Otherwise, the
+         data are read in two passes of `chunk_size` samples (one to compute the
+         statistics, one to detect clicks), and the detector state is carried
+         across chunk boundaries, so memory use does not depend on the length of
+         the recording.
+
+    Returns an array with the sample indices of the detected clicks.
+    """
+    if chunk_size is None:
+        data = dset[:].astype("d")
+        det.scale_thresh(data.mean(), data.std())
+        return np.asarray(det(data))
+    det.scale_thresh(*running_stats(dset, chunk_size))
+    det.reset()
+    clicks = []
+    for start in range(0, dset.shape[0], chunk_size):
+        chunk = dset[start:start + chunk_size].astype("d")
+        clicks.extend(start + idx for idx in det.send(chunk))
+    return np.asarray(clicks)
+
 #### present-audio
 
 
-def audiolog_to_trials(trials, data_file, sync_dset="channel37", sync_thresh=1.0):
+def read_audiolog_entry(entry, sync_dset, sync_thresh):
+    """Reads the timestamp and sync track of a present_audio entry
+
+    Returns (entry time, sync dataset name, number of samples, sampling rate,
+    detected clicks). Each call uses its own detector, so entries can be
+    processed concurrently.
+    """
+    dset = entry[sync_dset]
+    det = qs.detector(sync_thresh, 10)
+    clicks = detect_clicks(dset, det)
+    return entry_time(entry), dset.name, dset.size, dset.attrs["sampling_rate"], clicks
+
+
+# the ARF file opened by each worker process (see audiolog_to_trials)
+_audiolog_file = None
+
+
+def _open_audiolog_file(filename):
+    global _audiolog_file
+    _audiolog_file = h5.File(filename, "r")
+
+
+def _read_audiolog_worker(entry_name, sync_dset, sync_thresh):
+    return read_audiolog_entry(_audiolog_file[entry_name], sync_dset, sync_thresh)
+
+
+def audiolog_to_trials(trials, data_file, sync_dset="channel37", sync_thresh=1.0, jobs=1):
     """Parses a logfile from Margot's present_audio scripts for experiment structure
 
     trials: the "presentation" field in the json output of present_audio.py
     data_file: open handle to the hdf5 file generated by open-ephys during the recording
     sync_dset: the name of the dataset containing the synchronization signal
     sync_thresh: the threshold for detecting the sync signal
-    trials: number of trials per stimulus
+    jobs: the number of worker processes used to read entries and detect clicks.
+          Each worker opens `data_file.filename` read-only when it starts, so
+          the file must not be modified while the trials are extracted.
+          Trials are always yielded in index order.
     """
-    from arf import timestamp_to_float
+    import functools
+    import contextlib
 
     # Each element in this structure corresponds to a trial. In some cases the
     # data are stored as a dict/map, but the keys are just strings of the trial
     # number. The indices correspond to the entries in the arf file.
     n_trials = len(trials)
+    entry_names = ["/rec_%d" % i for i in range(n_trials)]
     expt_start = None
     sample_count = 0
-    det = qs.detector(sync_thresh, 10)
-    for i in range(n_trials):
-        pproc = {"events": [], "index": i}
-        pproc.update(trials[str(i)])
-        entry_name = "/rec_%d" % i
-        entry = data_file[entry_name]
-
-        # get time relative to first trial
-        time = entry_time(entry)
-        if expt_start is None:
-            expt_start = time
-        pproc["offset"] = time - expt_start
-        # find the sync signal - we expect one and only one click
-        dset = entry[sync_dset]
-        pproc["recording"] = {
-            "entry": entry_name,
-            "start": int(sample_count),
-            "stop": int(sample_count + dset.size),
-            "sampling_rate": dset.attrs["sampling_rate"],
-        }
-        sample_count += dset.size
-        sync = dset[:].astype("d")
-        det.scale_thresh(sync.mean(), sync.std())
-        clicks = det(sync)
-        if len(clicks) != 1:
-            log.error("%s: expected 1 click, detected %d", dset.name, len(clicks))
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers=jobs,
+                    initializer=_open_audiolog_file,
+                    initargs=(data_file.filename,),
+                )
+            )
+            results = executor.map(
+                functools.partial(
+                    _read_audiolog_worker, sync_dset=sync_dset, sync_thresh=sync_thresh
+                ),
+                entry_names,
+                chunksize=max(1, n_trials // (4 * jobs)),
+            )
         else:
-            pproc["stim_on"] = clicks[0] / dset.attrs["sampling_rate"]
-        yield pproc
+            results = (
+                read_audiolog_entry(data_file[name], sync_dset, sync_thresh)
+                for name in entry_names
+            )
+        for i, (entry_name, result) in enumerate(zip(entry_names, results)):
+            time, dset_name, n_samples, sampling_rate, clicks = result
+            pproc = {"events": [], "index": i}
+            pproc.update(trials[str(i)])
+            # get time relative to first trial
+            if expt_start is None:
+                expt_start = time
+            pproc["offset"] = time - expt_start
+            pproc["recording"] = {
+                "entry": entry_name,
+                "start": int(sample_count),
+                "stop": int(sample_count + n_samples),
+                "sampling_rate": sampling_rate,
+            }
+            sample_count += n_samples
+            # we expect one and only one click
+            if len(clicks) != 1:
+                log.error("%s: expected 1 click, detected %d", dset_name, len(clicks))
+            else:
+                pproc["stim_on"] = clicks[0] / sampling_rate
+            yield pproc
 
 
 def audiolog_to_pprox_script(argv=None):
@@ -104,6 +200,13 @@ def audiolog_to_pprox_script(argv=None):
         type=float,
         help="threshold (z-score) for detecting synchronization clicks",
     )
+    p.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of entries to process in parallel (default %(default)d)",
+    )
     p.add_argument("logfile", help="log file generated by present_audio.py")
     p.add_argument("recording", help="neurobank id or URL for the ARF recording")
     args = p.parse_args(argv)
@@ -123,7 +226,11 @@ def audiolog_to_pprox_script(argv=None):
             expt_log = json.load(lfp)
             trials = pprox.from_trials(
                 audiolog_to_trials(
-                    expt_log.pop("presentation"), afp, args.sync, args.sync_thresh
+                    expt_log.pop("presentation"),
+                    afp,
+                    args.sync,
+                    args.sync_thresh,
+                    args.jobs,
                 ),
                 recording=resource_url,
                 processed_by=["{} {}".format(p.prog, __version__)],
@@ -151,7 +258,77 @@ def parse_stim_id(path):
     return os.path.splitext(os.path.basename(path))[0]
 
 
-def oeaudio_to_trials(data_file, sync_dset=None, sync_thresh=1.0, prepad=1.0):
+def read_stim_log(stims):
+    """Reads a stimulus log dataset and classifies its messages
+
+    The whole dataset is read in a single operation, and the messages are
+    classified by their prefix in one vectorized pass. Returns a dict of arrays
+    with one element per row:
+
+    time: the sample index of the message
+    kind: "start", "stop", "metadata", or "" for any other message
+    argument: the part of the message after the prefix (bytes)
+    message: the full message (bytes)
+    """
+    data = stims[:]
+    if data.size == 0:
+        return {
+            "time": data["start"],
+            "kind": np.empty(0, dtype="U8"),
+            "argument": np.empty(0, dtype="S"),
+            "message": np.empty(0, dtype="S"),
+        }
+    # variable-length strings are read as object arrays
+    messages = np.asarray(data["message"]).astype("S")
+    kind = np.select(
+        [
+            np.char.startswith(messages, b"start "),
+            np.char.startswith(messages, b"stop "),
+            np.char.startswith(messages, b"metadata: {"),
+        ],
+        ["start", "stop", "metadata"],
+        default="",
+    )
+    return {
+        "time": data["start"],
+        "kind": kind,
+        "argument": np.char.partition(messages, b" ")[..., 2],
+        "message": messages,
+    }
+
+
+def scan_entries(data_file):
+    """Scans the entries of an oeaudio-present ARF file in a single pass
+
+    Returns a list with one dict per entry, sorted by time. Each dict contains the
+    entry ("entry"), its timestamp ("timestamp") and time in seconds ("time"),
+    the stimulus log dataset ("stims") and its sampling rate ("sampling_rate"),
+    and the parsed stimulus log ("stim_log", see `read_stim_log`). Pass the result
+    to `oeaudio_to_trials` and `entry_metadata` to avoid scanning the file twice.
+    """
+    from arf import timestamp_to_float
+
+    entries = []
+    for entry in data_file.values():
+        timestamp = entry.attrs["timestamp"]
+        stims = find_stim_dset(entry)
+        entries.append(
+            {
+                "entry": entry,
+                "timestamp": timestamp,
+                "time": timestamp_to_float(timestamp),
+                "stims": stims,
+                "sampling_rate": stims.attrs["sampling_rate"],
+                "stim_log": read_stim_log(stims),
+            }
+        )
+    entries.sort(key=lambda e: e["time"])
+    return entries
+
+
+def oeaudio_to_trials(
+    data_file, sync_dset=None, sync_thresh=1.0, prepad=1.0, chunk_size=None, entries=None
+):
     """Extracts trial information from an oeaudio-present experiment ARF file
 
     When using oeaudio-present, a single recording is made in response to all
@@ -168,28 +345,30 @@ def oeaudio_to_trials(data_file, sync_dset=None, sync_thresh=1.0, prepad=1.0):
     The `prepad` parameter specifies, in seconds, when trials begin relative to
     stimulus onset. The default is 1.0 s.
 
+    If `chunk_size` is not None, the sync track is read in blocks of that many
+    samples rather than all at once (see `detect_clicks`). If `entries` is not
+    None, it should be the output of `scan_entries(data_file)`.
+
     """
-    import copy
-    from arf import timestamp_to_float, timestamp_to_datetime
+    from arf import timestamp_to_datetime
 
-    re_start = re.compile(r"start (.*)")
-    re_stop = re.compile(r"stop (.*)")
+    if entries is None:
+        entries = scan_entries(data_file)
     expt_start = None
     index = 0
     det = qs.detector(sync_thresh, 10)
-    for entry_num, entry in enumerate(sorted(data_file.values(), key=entry_time)):
+    for entry_num, scanned in enumerate(entries):
+        entry = scanned["entry"]
         log.info("- entry: '%s'", entry.name)
-        entry_start = entry_time(entry)
-        log.info("  - start time: %s", timestamp_to_datetime(entry.attrs["timestamp"]))
+        entry_start = scanned["time"]
+        log.info("  - start time: %s", timestamp_to_datetime(scanned["timestamp"]))
         if expt_start is None:
             expt_start = entry_start
 
         if sync_dset is not None:
             sync = entry[sync_dset]
             log.info("  - sync track: '%s'", sync_dset)
-            sync_data = sync[:].astype("d")
-            det.scale_thresh(sync_data.mean(), sync_data.std())
-            stim_onsets = np.asarray(det(sync_data))
+            stim_onsets = detect_clicks(sync, det, chunk_size)
             log.info("    - detected %d clicks", stim_onsets.size)
             dset_offset = sync.attrs["offset"]
         else:
@@ -202,90 +381,91 @@ def oeaudio_to_trials(data_file, sync_dset=None, sync_thresh=1.0, prepad=1.0):
                     log.info("    - got clock offset from '%s'", dname)
                     break
 
-        stims = find_stim_dset(entry)
-        sampling_rate = stims.attrs["sampling_rate"]
+        sampling_rate = scanned["sampling_rate"]
         stim_sample_offset = int(dset_offset * sampling_rate)
         log.info("  - recording clock offset: %d", stim_sample_offset)
-        pproc_base = {
-            "events": [],
-            "recording": {"entry": entry_num},
-        }
+        stim_log = scanned["stim_log"]
+        kind = stim_log["kind"]
+        starts = np.flatnonzero(kind == "start")
+        stim_ids = [parse_stim_id(arg.decode("utf-8")) for arg in stim_log["argument"][starts]]
+
+        # the stop messages are just monitored to ensure data consistency
+        stops = np.flatnonzero(kind == "stop")
+        for row, prev in zip(stops, starts.searchsorted(stops) - 1):
+            stim = stim_log["argument"][row].decode("utf-8")
+            if prev < 0 or parse_stim_id(stim) != stim_ids[prev]:
+                log.warning("  - WARNING: stop event %s without matching start event", stim)
+        if log.isEnabledFor(logging.DEBUG):
+            for row in np.flatnonzero((kind != "start") & (kind != "stop")):
+                log.debug(
+                    " - skipping message at sample %d: '%s'",
+                    stim_log["time"][row],
+                    stim_log["message"][row].decode("utf-8"),
+                )
 
-        this_trial = None
-        for row in stims:
-            time = row["start"]
-            message = row["message"].decode("utf-8")
-            m = re_start.match(message)
-            if m is not None:
-                stim = parse_stim_id(m.group(1))
-                stim_on = time - stim_sample_offset
-                # adjust to next sync click
-                if sync_dset is not None:
-                    click_idx = stim_onsets.searchsorted(stim_on)
-                    log.debug(
-                        "  - trial %d: stim onset adjusted by %d",
-                        index,
-                        stim_onsets[click_idx] - stim_on,
-                    )
-                    stim_on = stim_onsets[click_idx]
-                trial_on = stim_on - int(prepad * sampling_rate)
-                if this_trial is not None:
-                    this_trial["recording"]["stop"] = trial_on
-                    index += 1
-                    yield this_trial
-                this_trial = copy.deepcopy(pproc_base)
-                if trial_on < 0:
-                    raise ValueError(
-                        "start of trial %d (%012d samples) precedes recording onset - "
-                        "adjust prepad" % (index, trial_on)
-                    )
-                this_trial.update(
-                    stim=stim,
-                    index=index,
-                    offset=(entry_start - expt_start) + float(trial_on / sampling_rate),
-                    stim_on=(stim_on - trial_on) / sampling_rate
+        stim_on = stim_log["time"][starts] - stim_sample_offset
+        if sync_dset is not None:
+            # adjust to next sync click
+            click_idx = stim_onsets.searchsorted(stim_on)
+            if np.any(click_idx >= stim_onsets.size):
+                raise ValueError(
+                    "no sync click after stimulus onset at %012d samples"
+                    % stim_on[click_idx.searchsorted(stim_onsets.size)]
                 )
-                this_trial["recording"]["start"] = trial_on
-                log.debug(
-                    "  - trial %d: start @ %012d samples (stim %s @ %012d)",
-                    index,
-                    trial_on,
-                    stim,
-                    stim_on,
+            stim_adjust = stim_onsets[click_idx] - stim_on
+            stim_on = stim_onsets[click_idx]
+        trial_on = stim_on - int(prepad * sampling_rate)
+
+        this_trial = None
+        for i, stim in enumerate(stim_ids):
+            if sync_dset is not None:
+                log.debug("  - trial %d: stim onset adjusted by %d", index, stim_adjust[i])
+            if this_trial is not None:
+                this_trial["recording"]["stop"] = trial_on[i]
+                index += 1
+                yield this_trial
+            if trial_on[i] < 0:
+                raise ValueError(
+                    "start of trial %d (%012d samples) precedes recording onset - "
+                    "adjust prepad" % (index, trial_on[i])
                 )
-                continue
-            # the stop messages are just monitored to ensure data consistency
-            m = re_stop.match(message)
-            if m is not None:
-                stim = parse_stim_id(m.group(1))
-                if this_trial is None or stim != this_trial["stim"]:
-                    log.warning(
-                        "  - WARNING: stop event %s without matching start event",
-                        m.group(1),
-                    )
-                continue
-            log.debug(" - skipping message at sample %d: '%s'", time, message)
-
-
-def entry_metadata(data_file):
-    re_metadata = re.compile(r"metadata: (\{.*\})")
-    for entry_num, entry in enumerate(sorted(data_file.values(), key=entry_time)):
-        stims = find_stim_dset(entry)
-        for row in stims:
-            time = row["start"]
-            message = row["message"].decode("utf-8")
-            m = re_metadata.match(message)
+            this_trial = {
+                "events": [],
+                "recording": {"entry": entry_num, "start": trial_on[i]},
+                "stim": stim,
+                "index": index,
+                "offset": (entry_start - expt_start) + float(trial_on[i] / sampling_rate),
+                "stim_on": (stim_on[i] - trial_on[i]) / sampling_rate,
+            }
+            log.debug(
+                "  - trial %d: start @ %012d samples (stim %s @ %012d)",
+                index,
+                trial_on[i],
+                stim,
+                stim_on[i],
+            )
+
+
+def entry_metadata(data_file, entries=None):
+    """Yields the metadata messages in the stimulus logs of an ARF file
+
+    If `entries` is not None, it should be the output of `scan_entries(data_file)`.
+    """
+    if entries is None:
+        entries = scan_entries(data_file)
+    for scanned in entries:
+        stim_log = scanned["stim_log"]
+        for arg in stim_log["argument"][stim_log["kind"] == "metadata"]:
             try:
-                metadata = json.loads(m.group(1))
-            except (AttributeError, json.JSONDecodeError):
+                metadata = json.loads(arg[:arg.rfind(b"}") + 1])
+            except json.JSONDecodeError:
                 pass
             else:
-                metadata.update(name=entry.name,
-                                sampling_rate=stims.attrs["sampling_rate"])
+                metadata.update(name=scanned["entry"].name,
+                                sampling_rate=scanned["sampling_rate"])
                 yield metadata
 
 
-
 def oeaudio_to_pprox_script(argv=None):
     import sys
     import argparse
@@ -328,6 +508,11 @@ def oeaudio_to_pprox_script(argv=None):
         type=float,
         help="threshold (z-score) for detecting sync clicks (default %(default)0.1f)",
     )
+    p.add_argument(
+        "--chunk-size",
+        type=int,
+        help="read the sync track in blocks of this many samples to limit memory usage",
+    )
     p.add_argument(
         "--no-neurobank",
         action="store_true",
@@ -358,13 +543,16 @@ def oeaudio_to_pprox_script(argv=None):
         log.warning(" - warning: not using a sync track!")
 
     with h5.File(datafile, "r") as afp:
+        entries = scan_entries(afp)
         trials = pprox.from_trials(
-            oeaudio_to_trials(afp, args.sync, args.sync_thresh, args.prepad),
+            oeaudio_to_trials(
+                afp, args.sync, args.sync_thresh, args.prepad, args.chunk_size, entries
+            ),
             recording=resource_url,
             processed_by=["{} {}".format(p.prog, __version__)],
             **resource_info["metadata"]
         )
-        trials["entry_metadata"] = tuple(entry_metadata(afp))
+        trials["entry_metadata"] = tuple(entry_metadata(afp, entries))
 
     json.dump(trials, args.output, default=json_serializable)
     if args.output != sys.stdout:
@@ -4,71 +4,317 @@
 import os
 import shutil
 import logging
+import numpy as np
 
 from dlab import core, __version__
+from dlab.pprox import ArrayPprox, TrialStream
 
 log = logging.getLogger('dlab.mountain')
 
-def load_spikes(path):
-    """Loads spike time data from an mda file and wrangles it into pandas """
+def load_spikes(path, pprox=None):
+    """Loads spike time data from a firings.mda file as a table of columns
+
+    Returns a dict with "channel", "sample", and "cluster" arrays. These are
+    views on the memory-mapped file, so nothing is read from disk until the
+    values are accessed. If `pprox` (the trial structure of the experiment) is
+    supplied, the table also has a "trial" column with the index of the trial
+    that contains each spike (-1 if none) and a "time" column with the time of
+    the spike relative to the start of the trial, in seconds (NaN if none).
+
+    The table can be converted to pandas with `pandas.DataFrame(load_spikes(path))`.
+
+    """
+    from arfx import mdaio
+
+    with mdaio.mdafile(path) as fp:
+        data = fp.read(memmap="r").reshape(-1, 3)
+    spikes = {"channel": data[:, 0], "sample": data[:, 1], "cluster": data[:, 2]}
+    if pprox is not None:
+        start, stop, sampling_rate = trial_bounds(pprox)
+        index = locate_events(start, stop, spikes["sample"])
+        valid = index >= 0
+        time = np.full(index.size, np.nan)
+        time[valid] = (spikes["sample"][valid] - start[index[valid]]) / sampling_rate[index[valid]]
+        spikes.update(trial=index, time=time)
+    return spikes
+
+
+def trial_bounds(pprox):
+    """Returns arrays with the start, stop, and sampling rate of each trial in pprox"""
+    if isinstance(pprox, ArrayPprox):
+        return (
+            pprox.columns["recording.start"].astype("i8"),
+            pprox.columns["recording.stop"].astype("i8"),
+            pprox.columns["recording.sampling_rate"],
+        )
+    recordings = [trial["recording"] for trial in pprox["pprox"]]
+    return (
+        np.array([r["start"] for r in recordings], dtype="i8"),
+        np.array([r["stop"] for r in recordings], dtype="i8"),
+        np.array([r["sampling_rate"] for r in recordings]),
+    )
+
+
+def locate_events(start, stop, time):
+    """Returns the index of the trial that contains each event, or -1 if there is none
+
+    start, stop: arrays with the start and stop of each trial, sorted by time
+    time: array of event times, in the same units as start and stop
+    """
+    # index of the first trial that ends at or after each event
+    index = stop.searchsorted(time)
+    valid = index < stop.size
+    valid[valid] = time[valid] >= start[index[valid]]
+    index[~valid] = -1
+    return index
+
+
+def read_firings(path, chunk_size=None):
+    """Reads (channel, time, cluster) rows from a firings.mda file in chunks
+
+    The file is memory-mapped, and each chunk of `chunk_size` rows is converted to
+    an int64 array as it is yielded, so the whole file is never copied into
+    memory. If `chunk_size` is None, the file is yielded as a single chunk.
+    """
+    from arfx import mdaio
+
+    with mdaio.mdafile(path) as fp:
+        data = fp.read(memmap="r")
+        n_rows = data.shape[0]
+        chunk_size = chunk_size or max(n_rows, 1)
+        for start in range(0, n_rows, chunk_size):
+            yield np.asarray(data[start:start + chunk_size]).astype("i8")
 
 
 def assign_events(pprox, events):
     """Assign events to trials within a pprox based on recording time.
 
-    trials: an iterable list of pproc objects, sorted in order of time. Each
-    object must have a "recording" field that contains "start" and "stop"
-    subfields. The values of these fields must indicate the start and stop time
-    of the trial.
+    pprox: a pprox object whose trials are sorted in order of time. Each trial
+    must have a "recording" field that contains "start", "stop", and
+    "sampling_rate" subfields. The values of the start and stop fields must
+    indicate the start and stop time of the trial (in samples).
+
+    events: an array of (channel, time, cluster) rows, sorted by time. This is
+    the layout of the firings.mda file generated by mountainsort.
+
+    Returns a dict of pprox objects, one for each cluster, in order of the first
+    event in each cluster. Event times are in seconds relative to the start of
+    the trial. A spike that falls on the boundary between two trials is assigned
+    to the earlier one; spikes that fall outside any trial are dropped.
+
+    Only the event lists are created for each cluster. The other fields of the
+    trials and the top-level metadata are shared with `pprox` and between
+    clusters, so they should be replaced rather than modified in place.
 
     """
-    from copy import deepcopy
+    return assign_event_chunks(pprox, (events,))
+
+
+def assign_event_chunks(pprox, chunks):
+    """Assign events to trials, reading the events incrementally.
+
+    This function is the same as `assign_events`, except that `chunks` is an
+    iterable of (channel, time, cluster) arrays (e.g., from `read_firings`).
+    Each chunk must follow the previous one in time.
+
+    If `pprox` is an ArrayPprox, so are the returned clusters. Their metadata
+    columns are shared with `pprox`. If the trials of `pprox` are a
+    TrialStream, they are read once and shared between the clusters.
+
+    """
+    array_form = isinstance(pprox, ArrayPprox)
+    if not array_form and isinstance(pprox.get("pprox"), TrialStream):
+        pprox = dict(pprox, pprox=tuple(pprox["pprox"]))
+    n_trials = len(pprox) if array_form else len(pprox["pprox"])
+    start, stop, sampling_rate = trial_bounds(pprox)
+    cluster_events = {}
+    cluster_channels = {}
+    for events in chunks:
+        events = np.asarray(events).reshape(-1, 3)
+        channel, time, clust = events.T
+        index = locate_events(start, stop, time)
+        valid = index >= 0
+        if not valid.all():
+            log.debug("%d spikes are outside the recording windows of the trials", valid.size - valid.sum())
+        channel, time, clust, index = channel[valid], time[valid], clust[valid], index[valid]
+        t_seconds = (time - start[index]) / sampling_rate[index]
+
+        # group by cluster; the stable sort keeps each cluster in order of time
+        order = np.argsort(clust, kind="stable")
+        cluster_ids, first, counts = np.unique(clust[order], return_index=True, return_counts=True)
+        for k in np.argsort(order[first], kind="stable"):
+            selected = order[first[k]:first[k] + counts[k]]
+            if cluster_ids[k] not in cluster_events:
+                cluster_events[cluster_ids[k]] = [] if array_form else [[] for _ in range(n_trials)]
+                cluster_channels[cluster_ids[k]] = channel[selected[0]]
+            cluster_times = t_seconds[selected]
+            if array_form:
+                # for ArrayPprox, the events are merged in one pass at the end
+                cluster_events[cluster_ids[k]].append((index[selected], cluster_times))
+                continue
+            trial_events = cluster_events[cluster_ids[k]]
+            touched, offsets = np.unique(index[selected], return_index=True)
+            offsets = np.append(offsets, selected.size)
+            for j, i in enumerate(touched):
+                trial_events[i].extend(cluster_times[offsets[j]:offsets[j + 1]].tolist())
 
     clusters = {}
-    trial_iter = enumerate(pprox["pprox"])
-    index, trial = next(trial_iter)
-    for channel, time, clust in events:
-        if time < trial["recording"]["start"]:
-            log.debug("spike at %d is before the start of trial %d", time, index)
-            continue
-        while time > trial["recording"]["stop"]:
-            index, trial = next(trial_iter)
-        t_seconds = (time - trial["recording"]["start"]) / trial["recording"]["sampling_rate"]
-        if clust not in clusters:
-            cluster = deepcopy(pprox)
-            cluster.update(cluster=clust, channel=channel)
-            clusters[clust] = cluster
-        clusters[clust]["pprox"][index]["events"].append(t_seconds)
+    if array_form:
+        old_offsets = pprox.offsets - pprox.offsets[0]
+        old_events = pprox.events[pprox.offsets[0]:pprox.offsets[-1]]
+        old_index = np.repeat(np.arange(n_trials), np.diff(old_offsets))
+        for clust_id, assigned in cluster_events.items():
+            new_index = np.concatenate([index for index, _ in assigned])
+            # a stable sort on the trial index puts the new events after the
+            # existing ones in each trial, and keeps them in order of time
+            order = np.argsort(np.concatenate([old_index, new_index]), kind="stable")
+            events = np.concatenate([old_events] + [times for _, times in assigned])[order]
+            offsets = old_offsets.copy()
+            offsets[1:] += np.add.accumulate(np.bincount(new_index, minlength=n_trials))
+            metadata = dict(pprox.metadata, cluster=clust_id, channel=cluster_channels[clust_id])
+            clusters[clust_id] = ArrayPprox(events, offsets, dict(pprox.columns), metadata)
+        return clusters
+    trials = pprox["pprox"]
+    for clust_id, trial_events in cluster_events.items():
+        cluster = dict(pprox, cluster=clust_id, channel=cluster_channels[clust_id])
+        cluster["pprox"] = tuple(
+            dict(trial, events=trial["events"] + events)
+            for trial, events in zip(trials, trial_events)
+        )
+        clusters[clust_id] = cluster
     return clusters
 
 
-def aggregate_events(pprox, use_recording=False):
+def _event_samples(trial, use_recording, out=None):
+    """Converts the event times in a trial to samples (see aggregate_events)"""
+    sampling_rate = trial["recording"]["sampling_rate"]
+    events = np.array(trial["events"], dtype="d")
+    if out is None:
+        out = np.empty(events.size, dtype="i8")
+    if use_recording:
+        np.multiply(events, sampling_rate, out=events)
+        out[:] = events
+        out += trial["recording"]["start"]
+    else:
+        np.add(events, trial["offset"], out=events)
+        np.multiply(events, sampling_rate, out=events)
+        out[:] = events
+    return out
+
+
+def aggregate_events(pprox, use_recording=False, return_offsets=False):
     """Aggregate all the events in a pprox into a single array.
 
     This function is primarily used for testing, as this should be the reverse
     operation to assign_events, assuming no gaps in the recording. If there are
     gaps, then set `use_recording` to True.
 
+    The events are counted first, and then converted into a single preallocated
+    int64 array. If `return_offsets` is True, returns (events, offsets), where
+    the events for trial i are in `events[offsets[i]:offsets[i + 1]]`.
+
+    `pprox` may be an ArrayPprox, in which case the conversion is done in a
+    single vectorized operation. If the trials are a TrialStream, they are read
+    in a single pass and converted one at a time.
+
     """
-    import numpy as np
-    all_events = []
-    for trial in pprox["pprox"]:
-        sampling_rate = trial["recording"]["sampling_rate"]
-        events = np.asarray(trial["events"])
+    if isinstance(pprox, ArrayPprox):
+        index = np.repeat(np.arange(len(pprox)), np.diff(pprox.offsets))
+        sampling_rate = pprox.columns["recording.sampling_rate"].astype("d")[index]
         if use_recording:
-            events = (events * sampling_rate).astype("i8") + trial["recording"]["start"]
+            all_events = (pprox.events * sampling_rate).astype("i8")
+            all_events += pprox.columns["recording.start"].astype("i8")[index]
         else:
-            events = ((events + trial["offset"]) * sampling_rate).astype("i8")
-        all_events.append(events)
-    return np.concatenate(all_events)
+            offset = pprox.columns["offset"].astype("d")[index]
+            all_events = ((pprox.events + offset) * sampling_rate).astype("i8")
+        if return_offsets:
+            return all_events, pprox.offsets.copy()
+        return all_events
+    trials = pprox["pprox"]
+    if isinstance(trials, TrialStream):
+        converted = [_event_samples(trial, use_recording) for trial in trials]
+        offsets = np.zeros(len(converted) + 1, dtype="i8")
+        np.cumsum([events.size for events in converted], out=offsets[1:])
+        all_events = np.concatenate(converted) if converted else np.empty(0, dtype="i8")
+    else:
+        offsets = np.zeros(len(trials) + 1, dtype="i8")
+        np.cumsum([len(trial["events"]) for trial in trials], out=offsets[1:])
+        all_events = np.empty(offsets[-1], dtype="i8")
+        for i, trial in enumerate(trials):
+            _event_samples(trial, use_recording, all_events[offsets[i]:offsets[i + 1]])
+    if return_offsets:
+        return all_events, offsets
+    return all_events
+
+
+def write_pprox(obj, path):
+    """Writes a pprox object to a JSON file.
+
+    The whole document is encoded in one call before it is written, which lets
+    the json module use its C encoder. Numpy scalars are converted with
+    `dlab.util.json_serializable`.
+
+    """
+    import json
+    from dlab.util import json_serializable
+
+    with open(path, "wt") as fp:
+        fp.write(json.dumps(obj, default=json_serializable))
+
+
+# clusters to be written by worker processes (see write_clusters)
+_clusters = None
+
+
+def _set_clusters(clusters):
+    global _clusters
+    _clusters = clusters
+
+
+def _write_cluster(clust_id, path, binary=False):
+    if binary:
+        from dlab.pprox import write_binary
+
+        write_binary(_clusters[clust_id], path)
+    else:
+        write_pprox(_clusters[clust_id], path)
+
+
+def write_clusters(clusters, paths, jobs=1, binary=False):
+    """Writes the pprox object for each cluster in `clusters` to the path in `paths`
+
+    If `jobs` is greater than 1, the files are encoded and written by a pool of
+    worker processes. The clusters are given to each worker when it starts, so
+    only the cluster ids are sent with each task. If `binary` is True, the
+    files are written in the binary pprox format (see `dlab.pprox.write_binary`).
+
+    """
+    if jobs <= 1:
+        _set_clusters(clusters)
+        try:
+            for clust_id, path in paths.items():
+                _write_cluster(clust_id, path, binary)
+        finally:
+            _set_clusters(None)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_set_clusters, initargs=(clusters,)
+    ) as executor:
+        futures = [
+            executor.submit(_write_cluster, clust_id, path, binary)
+            for clust_id, path in paths.items()
+        ]
+        for future in futures:
+            future.result()
 
 
 def group_spikes_script(argv=None):
     import nbank
     import argparse
     import json
-    from arfx import mdaio
-    from dlab.util import setup_log, json_serializable
+    from dlab.util import setup_log
     __version__ = "0.1.0"
 
     p = argparse.ArgumentParser(
@@ -88,6 +334,24 @@ def group_spikes_script(argv=None):
         "-n",
         help="base name of the unit (default is based on 'recording' field of trials pprox) ",
     )
+    p.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1000000,
+        help="number of spikes to read from the firings file at a time (default %(default)d)",
+    )
+    p.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="number of processes to use for writing output files (default %(default)d)",
+    )
+    p.add_argument(
+        "--binary",
+        action="store_true",
+        help="write output files in the binary pprox format (.pproxb) instead of JSON",
+    )
     p.add_argument("trials", help="pprox file with the trial structure of the experiment")
     p.add_argument("firings", help="firings.mda file generated by mountainsort")
     args = p.parse_args(argv)
@@ -98,23 +362,23 @@ def group_spikes_script(argv=None):
     with open(args.trials, "rt") as fp:
         pprox = json.load(fp)
     log.info("  - spike times: %s", args.firings)
-    with mdaio.mdafile(args.firings) as fp:
-        events = fp.read().astype("i8")
 
     if args.name is None:
         base, rec_id = nbank.parse_resource_id(pprox["recording"])
         args.name = rec_id
 
     log.info("- grouping spikes by cluster and trial...")
-    clusters = assign_events(pprox, events)
+    clusters = assign_event_chunks(pprox, read_firings(args.firings, args.chunk_size))
+    paths = {}
     for clust_id, cluster in clusters.items():
-        outfile = os.path.join(args.output or "", "{}_c{}.pprox".format(args.name, clust_id))
+        outfile = os.path.join(
+            args.output or "",
+            "{}_c{}.{}".format(args.name, clust_id, "pproxb" if args.binary else "pprox"),
+        )
         log.info("  - cluster %d -> %s", clust_id, outfile)
-        try:
-            pb = cluster["processed_by"]
-        except KeyError:
-            pb = []
-            cluster["processed_by"] = pb
-        pb.append("{} {}".format(p.prog, __version__))
-        with open(outfile, "wt") as ofp:
-            json.dump(cluster, ofp, default=json_serializable)
+        # processed_by is shared between clusters, so it can't be appended in place
+        cluster["processed_by"] = cluster.get("processed_by", []) + [
+            "{} {}".format(p.prog, __version__)
+        ]
+        paths[clust_id] = outfile
+    write_clusters(clusters, paths, args.jobs, args.binary)
@@ -4,14 +4,213 @@
 
 See https://meliza.org/spec:2/pprox/ for specification
 
-This package deliberately does not include any functions for serialization, as
-pprox objects are just python dictionaries.
+pprox objects are just python dictionaries, so they can be serialized with the
+json module. This module also provides a binary container format that can be
+memory-mapped (see `write_binary` and `read_binary`).
 
 Copyright (C) Dan Meliza, 2006-2020 (dan@meliza.org)
 
 """
+import os
+import json
+import uuid
+import struct
+import hashlib
+import numbers
+import functools
+import itertools
+import numpy as np
+
+from dlab.util import json_serializable
 
 _schema = "https://meliza.org/spec:2/pprox.json#"
+_binary_magic = b"PPROXBIN"
+_binary_version = 1
+_binary_align = 64
+
+
+class _Missing:
+    """Marks a field that is absent from a trial in an ArrayPprox column"""
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __reduce__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+def _escape(key):
+    """Escapes the dots (and backslashes) in a field name"""
+    return key.replace("\\", "\\\\").replace(".", "\\.")
+
+
+def _split(name):
+    """Splits a flattened column name into the field names it was made from"""
+    keys = []
+    key = []
+    chars = iter(name)
+    for c in chars:
+        if c == "\\":
+            key.append(next(chars, ""))
+        elif c == ".":
+            keys.append("".join(key))
+            key = []
+        else:
+            key.append(c)
+    keys.append("".join(key))
+    return keys
+
+
+def _flatten(trial, prefix=""):
+    """Yields (name, value) for the fields of a trial, flattening nested dicts
+
+    Nested field names are joined with dots. Dots and backslashes in the
+    field names themselves are escaped with a backslash, so that `_split`
+    can recover the original names.
+    """
+    for key, value in trial.items():
+        if not prefix and key == "events":
+            continue
+        name = prefix + _escape(key)
+        if isinstance(value, dict) and value:
+            yield from _flatten(value, name + ".")
+        else:
+            yield name, value
+
+
+def _kind(value):
+    """Returns the kind of a simple field value ("b", "i", "f", or "U"), or None"""
+    if isinstance(value, (bool, np.bool_)):
+        return "b"
+    if isinstance(value, (numbers.Integral, np.integer)):
+        return "i"
+    if isinstance(value, (numbers.Real, np.floating)):
+        return "f"
+    if isinstance(value, str):
+        return "U"
+    return None
+
+
+def _column(values):
+    """Converts a list of field values to an array, using an object array unless
+    all the values are of the same simple kind (Python or numpy scalars)"""
+    kinds = set(map(_kind, values))
+    if len(kinds) == 1 and None not in kinds:
+        col = np.array(values)
+        if col.dtype != object:
+            return col
+    col = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        col[i] = value
+    return col
+
+
+class ArrayPprox:
+    """A compact, array-backed representation of a pprox object
+
+    The events of all the trials are stored in a single float64 array, `events`,
+    and the events for trial i are `events[offsets[i]:offsets[i + 1]]`. The other
+    fields of the trials are stored in `columns`, a dict of arrays with one
+    element per trial. Nested fields are flattened into dotted names (e.g.,
+    "recording.start"), with any dots in the field names escaped by a
+    backslash (e.g., "a\\.b" for a field named "a.b"). Fields that are
+    absent from a trial have the value `MISSING`. The top-level fields are
+    stored in the `metadata` dict.
+
+    Use `from_pprox()` and `to_pprox()` to convert to and from the dict form.
+    ArrayPprox objects can also be used in place of the dict form: indexing with
+    "pprox" returns the trials as dicts, and indexing with any other key returns
+    the corresponding top-level field. Iterating yields the trials as dicts.
+
+    """
+
+    def __init__(self, events, offsets, columns=None, metadata=None):
+        self.events = np.asarray(events, dtype="d")
+        self.offsets = np.asarray(offsets, dtype="i8")
+        self.columns = columns if columns is not None else {}
+        self.metadata = metadata if metadata is not None else {}
+        # cache for index_trials
+        self._indexes = {}
+
+    @classmethod
+    def from_pprox(cls, obj):
+        """Converts a pprox object in dict form"""
+        trials = obj["pprox"]
+        offsets = np.zeros(len(trials) + 1, dtype="i8")
+        np.cumsum([len(trial["events"]) for trial in trials], out=offsets[1:])
+        events = np.fromiter(
+            itertools.chain.from_iterable(trial["events"] for trial in trials),
+            dtype="d",
+            count=offsets[-1],
+        )
+        fields = {}
+        for i, trial in enumerate(trials):
+            for name, value in _flatten(trial):
+                if name not in fields:
+                    fields[name] = [MISSING] * len(trials)
+                fields[name][i] = value
+        columns = {name: _column(values) for name, values in fields.items()}
+        metadata = {key: value for key, value in obj.items() if key != "pprox"}
+        return cls(events, offsets, columns, metadata)
+
+    def to_pprox(self):
+        """Converts to the dict form"""
+        return from_trials(iter(self), **self.metadata)
+
+    def __len__(self):
+        return self.offsets.size - 1
+
+    def __iter__(self):
+        return self._trials(0, len(self))
+
+    def _trials(self, start, stop):
+        """Yields trials start through stop - 1 as dicts"""
+        columns = [(_split(name), col[start:stop].tolist()) for name, col in self.columns.items()]
+        events = self.events[self.offsets[start]:self.offsets[stop]].tolist()
+        offsets = self.offsets[start:stop + 1] - self.offsets[start]
+        for i in range(stop - start):
+            trial = {"events": events[offsets[i]:offsets[i + 1]]}
+            for path, values in columns:
+                if values[i] is not MISSING:
+                    target = trial
+                    for key in path[:-1]:
+                        target = target.setdefault(key, {})
+                    target[path[-1]] = values[i]
+            yield trial
+
+    def __getitem__(self, key):
+        if key == "pprox":
+            return tuple(self)
+        return self.metadata[key]
+
+    def __contains__(self, key):
+        return key == "pprox" or key in self.metadata
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def trial(self, i):
+        """Returns trial i as a dict"""
+        if not 0 <= i < len(self):
+            raise IndexError("trial index out of range")
+        return next(self._trials(i, i + 1))
+
+    def trial_events(self, i):
+        """Returns the events for trial i (a view on `events`)"""
+        return self.events[self.offsets[i]:self.offsets[i + 1]]
+
+    def __repr__(self):
+        return "<ArrayPprox: %d trials, %d events, fields: %s>" % (
+            len(self),
+            self.events.size,
+            ", ".join(self.columns),
+        )
 
 
 def empty():
@@ -20,15 +219,24 @@ def empty():
 
 
 def from_trials(trials, **metadata):
-    """Wrap a sequence of trials in a pprox object, optionally specifying top-level metadata"""
-    d = { "$schema": _schema, "pprox": tuple(trials) }
+    """Wrap a sequence of trials in a pprox object, optionally specifying top-level metadata
+
+    If `trials` is an ArrayPprox, it is converted to dict form, including its
+    top-level metadata. If `trials` is a TrialStream, it is not read into memory.
+    """
+    if isinstance(trials, ArrayPprox):
+        d = trials.to_pprox()
+        d.update(**metadata)
+        return d
+    if not isinstance(trials, TrialStream):
+        trials = tuple(trials)
+    d = { "$schema": _schema, "pprox": trials }
     d.update(**metadata)
     return d
 
 
 def wrap_uuid(b):
     """ Wrap a UUID (string or bytes) in a URN string """
-    import uuid
     try:
         b = b.decode("ascii")
     except AttributeError:
@@ -36,22 +244,655 @@ def wrap_uuid(b):
     return uuid.UUID(b).urn
 
 
-def groupby(obj, *keys):
+# cache for index_trials, for pprox objects in dict form. Neither dicts nor
+# trial lists can hold attributes or weak references, so the cache keeps a
+# reference to the trials of each object it indexes. It is kept small so that
+# it does not keep many large objects alive.
+_index_cache = {}
+_index_cache_size = 4
+
+
+def clear_index_cache():
+    """Discards the cached indexes of pprox objects in dict form"""
+    _index_cache.clear()
+
+
+def _field(trial, name):
+    """Returns the value of a (possibly dotted) field in a trial, or MISSING"""
+    try:
+        return trial[name]
+    except KeyError:
+        pass
+    value = trial
+    for key in name.split("."):
+        try:
+            value = value[key]
+        except (KeyError, TypeError):
+            return MISSING
+    return value
+
+
+def index_trials(obj, *keys):
+    """Returns a dict mapping values of `keys` to the indices of the matching trials
+
+    The keys of the dict are the values of the field if there is one key, or
+    tuples of the values if there are more. Nested fields can be specified with
+    dotted names (e.g. "recording.entry"). Trials that lack a field are indexed
+    under `MISSING`.
+
+    The index is cached, so building it is O(n) the first time it is requested
+    for an object and a set of keys, and O(1) after that. The cache does not
+    detect changes to the trials, so don't modify them after indexing.
+
+    For an ArrayPprox, the index is stored on the object and is freed with it.
+    For the dict form, the indexes of the last few objects (and references to
+    their trials) are kept in a module-level cache, which keeps those objects
+    alive until they are displaced or `clear_index_cache()` is called. Convert
+    large objects to ArrayPprox if they will be indexed many times.
+
+    """
+    if isinstance(obj, ArrayPprox):
+        if keys not in obj._indexes:
+            columns = [obj.columns.get(key, np.full(len(obj), MISSING)).tolist() for key in keys]
+            obj._indexes[keys] = _build_index(zip(*columns) if len(keys) > 1 else columns[0])
+        return obj._indexes[keys]
+    trials = obj["pprox"]
+    cache_key = (id(trials), keys)
+    cached = _index_cache.pop(cache_key, None)
+    if cached is None or cached[0] is not trials or cached[1] != len(trials):
+        if len(keys) == 1:
+            values = (_field(trial, keys[0]) for trial in trials)
+        else:
+            values = (tuple(_field(trial, key) for key in keys) for trial in trials)
+        cached = (trials, len(trials), _build_index(values))
+    _index_cache[cache_key] = cached
+    while len(_index_cache) > _index_cache_size:
+        del _index_cache[next(iter(_index_cache))]
+    return cached[2]
+
+
+def _build_index(values):
+    index = {}
+    for i, value in enumerate(values):
+        index.setdefault(value, []).append(i)
+    return {value: np.array(indices) for value, indices in index.items()}
+
+
+def _sort_key(value):
+    """Orders numbers, then strings, then other values by repr, then MISSING"""
+    if value is MISSING:
+        return (3, "")
+    if isinstance(value, (numbers.Real, np.integer, np.floating)):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, repr(value))
+
+
+def groupby(obj, *keys, events=False):
     """Iterate through pprocs based on keys
 
-    For example, if "stim" and "trial" are metadata on the trials, collate(obj, "stim") will yield
-    (stim0, [events_trial0, events_trial1]), (stim1, [events_trial0, events_trial1]), ...
+    For example, if "stim" and "trial" are metadata on the trials, groupby(obj, "stim") will yield
+    (stim0, [trial0, trial1]), (stim1, [trial0, trial1]), ...
+
+    Groups are yielded in order of their keys: numbers first, then strings,
+    then any other values (ordered by their repr), and last the trials that
+    lack the key (`MISSING`). Trials within each group are in their original
+    order. If `events` is True,
+    the event arrays of the trials are yielded instead of the trials. The
+    grouping uses the cached index from `index_trials`.
 
     """
-    import itertools
-    import operator
-    keyfun = operator.itemgetter(keys)
-    evsorted = sorted(obj['pprox'], keyfun)
-    return itertools.groupby(evsorted, keyfun)
+    index = index_trials(obj, *keys)
+    if len(keys) > 1:
+        values = sorted(index, key=lambda value: tuple(map(_sort_key, value)))
+    else:
+        values = sorted(index, key=_sort_key)
+    for value in values:
+        if isinstance(obj, ArrayPprox):
+            if events:
+                yield value, [obj.trial_events(i) for i in index[value]]
+            else:
+                yield value, [obj.trial(i) for i in index[value]]
+        else:
+            trials = obj["pprox"]
+            if events:
+                yield value, [np.asarray(trials[i]["events"]) for i in index[value]]
+            else:
+                yield value, [trials[i] for i in index[value]]
+
+
+def _schema_path():
+    return os.path.join(os.path.dirname(__file__), "pprox.json")
 
 
-def validate(obj):
-    """Validates object against pprox schema"""
+@functools.lru_cache(maxsize=None)
+def _validator():
+    """Returns a validator for the bundled pprox schema, compiled once per process
+
+    The type checker is extended so that objects built in python (with tuples,
+    numpy scalars and arrays) can be validated without serializing them first.
+    """
     import jsonschema
-    import requests
-    pass
+
+    with open(_schema_path(), "rt") as fp:
+        schema = json.load(fp)
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    base = cls.TYPE_CHECKER
+    checker = base.redefine_many(
+        {
+            "array": lambda c, x: base.is_type(x, "array")
+            or isinstance(x, (tuple, np.ndarray, TrialStream)),
+            "integer": lambda c, x: base.is_type(x, "integer") or isinstance(x, np.integer),
+            "number": lambda c, x: _is_number(x),
+        }
+    )
+    return jsonschema.validators.extend(cls, type_checker=checker)(schema)
+
+
+def _is_number(value):
+    return isinstance(value, (numbers.Real, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def _number_column(col, name):
+    """Returns an ArrayPprox column as a float array, with NaN for missing values
+
+    Raises ValueError if any of the values that are present is not a number.
+    """
+    if col.dtype.kind in "iuf":
+        return col.astype("d")
+    if col.dtype == object:
+        present = np.array([value is not MISSING for value in col], dtype=bool)
+        if all(_is_number(value) for value in col[present]):
+            values = np.full(col.size, np.nan)
+            values[present] = col[present].astype("d")
+            return values
+    raise ValueError("%s must contain only numbers" % name)
+
+
+def check_structure(obj):
+    """Checks the fields of a pprox object that the dlab tools depend on
+
+    This is a fast alternative to full schema validation for trusted inputs.
+    Each trial must have an `events` array of numbers; if present, `offset`
+    must be a number, and `recording` must have integer `start` <= `stop`
+    and a positive `sampling_rate`. Raises ValueError if a check fails.
+
+    """
+    if isinstance(obj, ArrayPprox):
+        offsets = obj.offsets
+        if offsets.ndim != 1 or offsets.size < 1 or offsets[0] != 0 or offsets[-1] != obj.events.size:
+            raise ValueError("trial offsets do not match the event array")
+        if np.any(np.diff(offsets) < 0):
+            raise ValueError("trial offsets are not monotonic")
+        trials = ()
+        columns = {
+            name: _number_column(obj.columns[name], name)
+            for name in ("offset", "recording.start", "recording.stop", "recording.sampling_rate")
+            if name in obj.columns
+        }
+        if "recording.start" in columns and "recording.stop" in columns:
+            start = columns["recording.start"]
+            stop = columns["recording.stop"]
+            if np.any(start > stop):
+                raise ValueError("recording.start is after recording.stop")
+        if "recording.sampling_rate" in columns and np.any(columns["recording.sampling_rate"] <= 0):
+            raise ValueError("recording.sampling_rate must be positive")
+    else:
+        try:
+            trials = obj["pprox"]
+        except (KeyError, TypeError) as err:
+            raise ValueError("object is missing the 'pprox' field") from err
+    for i, trial in enumerate(trials):
+        try:
+            events = np.asarray(trial["events"])
+        except KeyError as err:
+            raise ValueError("trial %d is missing the 'events' field" % i) from err
+        if events.ndim != 1 or (events.size and events.dtype.kind not in "iuf"):
+            raise ValueError("trial %d: events must be an array of numbers" % i)
+        if "offset" in trial and not _is_number(trial["offset"]):
+            raise ValueError("trial %d: offset must be a number" % i)
+        recording = trial.get("recording")
+        if recording is None:
+            continue
+        start = recording.get("start", 0)
+        stop = recording.get("stop", start)
+        for name, value in (("start", start), ("stop", stop)):
+            if not isinstance(value, (numbers.Integral, np.integer)) or isinstance(value, bool):
+                raise ValueError("trial %d: recording.%s must be an integer" % (i, name))
+        if start > stop:
+            raise ValueError("trial %d: recording.start is after recording.stop" % i)
+        if "sampling_rate" in recording:
+            sampling_rate = recording["sampling_rate"]
+            if not _is_number(sampling_rate) or sampling_rate <= 0:
+                raise ValueError("trial %d: recording.sampling_rate must be a positive number" % i)
+
+
+def validate(obj, trusted=False):
+    """Validates object against pprox schema
+
+    The schema is bundled with the package, so no network access is needed. The
+    object is checked against the schema and then with `check_structure`. If
+    `trusted` is True, only `check_structure` is run, and jsonschema is not
+    required. Raises ValueError if the object is not valid.
+
+    """
+    if not trusted:
+        import jsonschema
+
+        try:
+            _validator().validate(obj.to_pprox() if isinstance(obj, ArrayPprox) else obj)
+        except jsonschema.ValidationError as err:
+            raise ValueError("invalid pprox: %s" % err.message) from err
+    check_structure(obj)
+
+
+def _align(n):
+    return -(-n // _binary_align) * _binary_align
+
+
+def write_binary(obj, path):
+    """Writes a pprox object (dict form or ArrayPprox) to a binary container file
+
+    The file starts with an 8-byte magic string, the length of the header as
+    a little-endian uint64, and a JSON header with the top-level metadata and
+    the layout of the arrays. The event array, the trial offsets, and the
+    numeric and string metadata columns follow as raw arrays, each aligned to a
+    64-byte boundary so that they can be memory-mapped. Columns with other
+    types of values are stored in the header.
+
+    The file is written to a temporary file in the same directory and then
+    renamed to `path`, so it is safe to write an object back to the file it
+    was memory-mapped from.
+
+    """
+    if not isinstance(obj, ArrayPprox):
+        obj = ArrayPprox.from_pprox(obj)
+    arrays = [("events", obj.events), ("offsets", obj.offsets)]
+    columns = {}
+    for name, col in obj.columns.items():
+        if col.dtype == object:
+            missing = [i for i, value in enumerate(col) if value is MISSING]
+            values = [None if value is MISSING else value for value in col]
+            columns[name] = {"values": values, "missing": missing}
+        else:
+            columns[name] = {"array": len(arrays)}
+            arrays.append((name, col))
+    layout = []
+    offset = 0
+    for _, array in arrays:
+        array = np.ascontiguousarray(array)
+        layout.append({"dtype": array.dtype.str, "shape": array.shape, "offset": offset})
+        offset = _align(offset + array.nbytes)
+    header = json.dumps(
+        {
+            "version": _binary_version,
+            "metadata": obj.metadata,
+            "columns": columns,
+            "arrays": layout,
+        },
+        default=json_serializable,
+    ).encode("utf-8")
+    data_start = _align(len(_binary_magic) + 8 + len(header))
+    # write to a temporary file and move it into place, because the target may
+    # be memory-mapped (e.g., if obj was loaded from it with read_binary)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "xb") as fp:
+            fp.write(_binary_magic + struct.pack("<Q", len(header)) + header)
+            for (_, array), spec in zip(arrays, layout):
+                fp.seek(data_start + spec["offset"])
+                fp.write(np.ascontiguousarray(array).tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_binary(path, mmap=True):
+    """Reads a pprox object from a binary container file (see `write_binary`)
+
+    Returns an ArrayPprox. If `mmap` is True, the event array and the
+    numeric and string columns are memory-mapped, so only the parts that are
+    accessed are read from disk. Otherwise, they are read into memory.
+
+    """
+    with open(path, "rb") as fp:
+        magic = fp.read(len(_binary_magic))
+        if magic != _binary_magic:
+            raise ValueError("%s is not a binary pprox file" % path)
+        (header_size,) = struct.unpack("<Q", fp.read(8))
+        header = json.loads(fp.read(header_size).decode("utf-8"))
+        if header["version"] > _binary_version:
+            raise ValueError("%s: unsupported binary pprox version %d" % (path, header["version"]))
+        data_start = _align(len(_binary_magic) + 8 + header_size)
+        arrays = []
+        for spec in header["arrays"]:
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            count = int(np.prod(shape))
+            if mmap and count > 0:
+                array = np.memmap(fp, dtype=dtype, mode="r", offset=data_start + spec["offset"], shape=shape)
+            else:
+                fp.seek(data_start + spec["offset"])
+                array = np.fromfile(fp, dtype=dtype, count=count).reshape(shape)
+            arrays.append(array)
+    columns = {}
+    for name, spec in header["columns"].items():
+        if "array" in spec:
+            columns[name] = arrays[spec["array"]]
+        else:
+            col = _column(spec["values"])
+            if spec["missing"]:
+                col = col.astype(object)
+                col[spec["missing"]] = MISSING
+            columns[name] = col
+    return ArrayPprox(arrays[0], arrays[1], columns, header["metadata"])
+
+
+def load(path, mmap=True):
+    """Loads a pprox object from a JSON or binary container file
+
+    JSON files are returned in dict form, and binary files as an ArrayPprox (see
+    `read_binary`).
+
+    """
+    with open(path, "rb") as fp:
+        binary = fp.read(len(_binary_magic)) == _binary_magic
+    if binary:
+        return read_binary(path, mmap)
+    with open(path, "rt") as fp:
+        return json.load(fp)
+
+
+class _JSONStream:
+    """Decodes the values in a JSON document one at a time, reading it in chunks"""
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Reads more of the file into the buffer. Returns False at end of file"""
+        # read at least as much as is already buffered, so that decoding a
+        # large value is not retried too many times
+        chunk = self.fp.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character (empty at end of file)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        """Consumes the next character, which must be one of `chars`"""
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("malformed pprox document: expected one of %r, got %r" % (chars, c))
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decodes and consumes the next value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # a number may be cut off by the end of the buffer, either at
+            # the end of the buffer or just before a '.', exponent, or sign
+            # (e.g. "12." + "5" decodes as 12 followed by ".")
+            if (
+                isinstance(value, (int, float))
+                and not isinstance(value, bool)
+                and (end == len(self.buf) or self.buf[end] in ".eE+-")
+                and not self.eof
+                and self._fill()
+            ):
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_document(path, chunk_size):
+    """Parses a pprox JSON file incrementally
+
+    Yields (key, value) for each top-level field except "pprox", and (None,
+    trial) for each trial.
+    """
+    with open(path, "rt", encoding="utf-8") as fp:
+        stream = _JSONStream(fp, chunk_size)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "pprox":
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        yield None, stream.value()
+                        if stream.expect(",]") == "]":
+                            break
+            else:
+                yield key, stream.value()
+            if stream.expect(",}") == "}":
+                return
+
+
+class TrialStream:
+    """Yields the trials of a pprox JSON file one at a time
+
+    Each iteration reads the file again from the start, so only one trial is
+    held in memory at a time. Use `stream()` to create a pprox object with a
+    TrialStream in place of the trial list.
+
+    """
+
+    def __init__(self, path, chunk_size=1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for key, value in _iter_document(self.path, self.chunk_size):
+            if key is None:
+                yield value
+
+    def __repr__(self):
+        return "<TrialStream: %s>" % self.path
+
+
+def stream(path, chunk_size=1 << 20):
+    """Opens a pprox JSON file for incremental reading
+
+    Returns a pprox object in dict form with the top-level metadata of the file.
+    The "pprox" field is a TrialStream, which yields trials as they are read
+    from the file. The metadata are read with an initial pass through the
+    file, because they may come after the trials. Neither pass keeps more than
+    one trial in memory. The file is read `chunk_size` characters at a time.
+
+    The returned object can be passed to `dlab.mountain.assign_events` and
+    `dlab.mountain.aggregate_events`, and to `from_trials`.
+
+    """
+    metadata = {key: value for key, value in _iter_document(path, chunk_size) if key is not None}
+    return from_trials(TrialStream(path, chunk_size), **metadata)
+
+
+def _file_hash(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _summarize(path):
+    """Computes the DatasetIndex record for a JSON or binary pprox file"""
+    with open(path, "rb") as fp:
+        binary = fp.read(len(_binary_magic)) == _binary_magic
+    stims = set()
+    if binary:
+        obj = read_binary(path)
+        metadata = obj.metadata
+        n_trials = len(obj)
+        n_events = int(obj.events.size)
+        if "stim" in obj.columns:
+            stims.update(obj.columns["stim"].tolist())
+    else:
+        metadata = {}
+        n_trials = n_events = 0
+        for key, value in _iter_document(path, 1 << 20):
+            if key is not None:
+                metadata[key] = value
+                continue
+            n_trials += 1
+            n_events += len(value["events"])
+            stims.add(value.get("stim", MISSING))
+    stims.discard(MISSING)
+    return {
+        "binary": binary,
+        "recording": metadata.get("recording"),
+        "cluster": metadata.get("cluster"),
+        "channel": metadata.get("channel"),
+        "stims": sorted(stims, key=str),
+        "n_trials": n_trials,
+        "n_events": n_events,
+    }
+
+
+class DatasetIndex:
+    """An index of the metadata in a collection of pprox files
+
+    For each file, the index records the recording, cluster, and channel, the
+    stimuli that were presented, and the number of trials and events. The index
+    can be saved to and loaded from a JSON file. Calling `update()` only
+    rereads files whose modification time or size has changed and whose
+    contents (checked by SHA-1 hash) are different.
+
+    Example:
+    >>> index = DatasetIndex("units.idx")
+    >>> index.update(glob.glob("*.pprox"))
+    >>> index.save()
+    >>> index.query(recording=url, stim="song_1")
+
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.files = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "rt") as fp:
+                self.files = json.load(fp)["files"]
+
+    def save(self, path=None):
+        """Saves the index to `path` (or the path it was loaded from)"""
+        path = path or self.path
+        with open(path, "wt") as fp:
+            json.dump({"version": 1, "files": self.files}, fp, default=json_serializable)
+        self.path = path
+
+    def update(self, paths):
+        """Adds the files in `paths` to the index, or updates them if they have changed
+
+        Records for files that no longer exist are removed. Returns the list of
+        files that were (re)read.
+
+        """
+        updated = []
+        for path in paths:
+            stat = os.stat(path)
+            record = self.files.get(path)
+            if record is not None and (record["mtime"], record["size"]) == (stat.st_mtime, stat.st_size):
+                continue
+            sha1 = _file_hash(path)
+            if record is None or record["sha1"] != sha1:
+                record = _summarize(path)
+                updated.append(path)
+            record.update(mtime=stat.st_mtime, size=stat.st_size, sha1=sha1)
+            self.files[path] = record
+        for path in [path for path in self.files if not os.path.exists(path)]:
+            del self.files[path]
+        return updated
+
+    @staticmethod
+    def _matches(record, criteria):
+        for key, value in criteria.items():
+            if key == "stim":
+                if callable(value):
+                    matched = any(value(stim) for stim in record["stims"])
+                else:
+                    matched = value in record["stims"]
+            elif callable(value):
+                matched = value(record.get(key))
+            else:
+                matched = record.get(key) == value
+            if not matched:
+                return False
+        return True
+
+    def query(self, **criteria):
+        """Returns the paths of the files that match all the criteria
+
+        Each keyword argument gives a field of the index records ("recording",
+        "cluster", "channel", "n_trials", "n_events", etc.) and the value it must
+        equal, or a function that returns True for matching values. The special
+        criterion `stim` matches files in which that stimulus was presented (or
+        any stimulus for which the function returns True).
+
+        """
+        return [path for path, record in self.files.items() if self._matches(record, criteria)]
+
+    def trials(self, **criteria):
+        """Yields (path, trial) for the trials in the files that match `criteria`
+
+        The criteria are the same as for `query()`. If `stim` is specified,
+        only trials with that stimulus are yielded. JSON files are streamed, so
+        only one trial is held in memory at a time, and binary files are
+        memory-mapped, so only the matching trials are read.
+
+        """
+        stim = criteria.get("stim")
+        if stim is None:
+            matches = lambda value: True
+        elif callable(stim):
+            matches = stim
+        else:
+            matches = lambda value: value == stim
+        for path in self.query(**criteria):
+            if self.files[path]["binary"]:
+                obj = read_binary(path)
+                if "stim" in obj.columns:
+                    values = obj.columns["stim"].tolist()
+                else:
+                    values = [MISSING] * len(obj)
+                for i, value in enumerate(values):
+                    if stim is None or (value is not MISSING and matches(value)):
+                        yield path, obj.trial(i)
+            else:
+                for trial in stream(path)["pprox"]:
+                    if stim is None or ("stim" in trial and matches(trial["stim"])):
+                        yield path, trial
+
+    def __len__(self):
+        return len(self.files)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Compute spike counts, firing rates, and PSTHs from pprox data
+
+All the functions take pprox objects in dict form, ArrayPprox objects, or
+streamed pprox objects (see `dlab.pprox.stream`). Event times are binned for
+all the trials of a unit (or all the units in a batch) in a single bincount
+call, and smoothing is done by FFT convolution along the time axis.
+
+Bins are given as an array of edges, in seconds relative to the start of each
+trial. As in `numpy.histogram`, the last bin includes its right edge.
+
+"""
+import itertools
+import numpy as np
+
+from dlab.pprox import ArrayPprox
+
+
+def event_arrays(obj):
+    """Returns (events, offsets) for a pprox object
+
+    The events for trial i are `events[offsets[i]:offsets[i + 1]]`. For an
+    ArrayPprox, these are the arrays it already holds.
+    """
+    if isinstance(obj, ArrayPprox):
+        return obj.events, obj.offsets
+    trials = obj["pprox"]
+    counts = []
+    chunks = []
+    for trial in trials:
+        counts.append(len(trial["events"]))
+        chunks.append(trial["events"])
+    offsets = np.zeros(len(counts) + 1, dtype="i8")
+    np.cumsum(counts, out=offsets[1:])
+    events = np.fromiter(itertools.chain.from_iterable(chunks), dtype="d", count=offsets[-1])
+    return events, offsets
+
+
+def _bin_index(events, bins):
+    """Returns the bin of each event, or -1 if it is outside the bins"""
+    bins = np.asarray(bins, dtype="d")
+    n_bins = bins.size - 1
+    index = bins.searchsorted(events, side="right") - 1
+    index[events == bins[-1]] = n_bins - 1
+    index[(index < 0) | (index >= n_bins)] = -1
+    return index
+
+
+def _count(events, offsets, bins):
+    """Counts events in bins for each trial. Returns an int64 array (trials, bins)"""
+    n_trials = offsets.size - 1
+    n_bins = len(bins) - 1
+    trial = np.repeat(np.arange(n_trials), np.diff(offsets))
+    index = _bin_index(events, bins)
+    valid = index >= 0
+    flat = trial[valid] * n_bins + index[valid]
+    return np.bincount(flat, minlength=n_trials * n_bins).reshape(n_trials, n_bins)
+
+
+def count_matrix(obj, bins):
+    """Counts the events of each trial in a set of bins
+
+    Returns an int64 array with shape (trials, bins).
+    """
+    events, offsets = event_arrays(obj)
+    return _count(events, offsets, bins)
+
+
+def gaussian_kernel(bandwidth, binwidth, truncate=4.0):
+    """Returns a normalized Gaussian smoothing kernel
+
+    bandwidth: the standard deviation of the kernel (s)
+    binwidth: the width of the bins the kernel will be applied to (s)
+    truncate: the kernel extends this many standard deviations on either side
+    """
+    sigma = bandwidth / binwidth
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
+    return kernel / kernel.sum()
+
+
+def smooth(data, kernel, axis=-1):
+    """Convolves data with a kernel along an axis, using the FFT
+
+    The kernel is centered on each point, so the output has the same shape as the
+    input. Values beyond the ends of the data are treated as zero.
+    """
+    data = np.asarray(data, dtype="d")
+    kernel = np.asarray(kernel, dtype="d")
+    n = data.shape[axis]
+    n_full = n + kernel.size - 1
+    n_fft = 1 << (n_full - 1).bit_length()
+    spectrum = np.fft.rfft(data, n_fft, axis=axis)
+    shape = [1] * data.ndim
+    shape[axis] = -1
+    spectrum *= np.fft.rfft(kernel, n_fft).reshape(shape)
+    full = np.fft.irfft(spectrum, n_fft, axis=axis)
+    start = (kernel.size - 1) // 2
+    return np.take(full, np.arange(start, start + n), axis=axis)
+
+
+def _rates(counts, bins, bandwidth):
+    rates = counts / np.diff(bins)
+    if bandwidth is not None:
+        binwidth = bins[1] - bins[0]
+        if not np.allclose(np.diff(bins), binwidth):
+            raise ValueError("smoothing requires bins of equal width")
+        rates = smooth(rates, gaussian_kernel(bandwidth, binwidth))
+    return rates
+
+
+def rate(obj, bins, bandwidth=None):
+    """Computes the firing rate (events/s) in each trial
+
+    If `bandwidth` is not None, the rates are smoothed with a Gaussian kernel
+    with that standard deviation (in s). Returns an array (trials, bins).
+    """
+    bins = np.asarray(bins, dtype="d")
+    return _rates(count_matrix(obj, bins), bins, bandwidth)
+
+
+def psth(obj, bins, bandwidth=None):
+    """Computes the peri-stimulus time histogram (mean rate across trials)"""
+    bins = np.asarray(bins, dtype="d")
+    counts = count_matrix(obj, bins)
+    return _rates(counts.sum(0) / max(counts.shape[0], 1), bins, bandwidth)
+
+
+def population_psth(objs, bins, bandwidth=None):
+    """Computes the PSTHs for a batch of units
+
+    objs: a sequence of pprox objects, one per unit
+    bins: bin edges (s), shared by all the units
+
+    The events of all the units are binned with a single bincount call, and
+    the PSTHs are smoothed together. Returns an array (units, bins).
+    """
+    bins = np.asarray(bins, dtype="d")
+    n_bins = bins.size - 1
+    arrays = [event_arrays(obj) for obj in objs]
+    n_units = len(arrays)
+    n_trials = np.array([offsets.size - 1 for _, offsets in arrays])
+    events = np.concatenate([events for events, _ in arrays]) if arrays else np.empty(0)
+    unit = np.repeat(np.arange(n_units), [events.size for events, _ in arrays])
+    index = _bin_index(events, bins)
+    valid = index >= 0
+    counts = np.bincount(
+        unit[valid] * n_bins + index[valid], minlength=n_units * n_bins
+    ).reshape(n_units, n_bins)
+    return _rates(counts / np.maximum(n_trials, 1)[:, np.newaxis], bins, bandwidth)
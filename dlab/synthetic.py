@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+"""Generate synthetic recordings for testing and benchmarking
+
+The ARF files written by this module have the layout that `dlab.extracellular`
+expects from oeaudio-present and present_audio experiments, with synthetic
+neural channels and sync clicks at known times. All the datasets are written
+in blocks of `chunk_size` samples, so memory use does not depend on the
+length of the recording.
+
+"""
+import json
+import logging
+import numpy as np
+import h5py as h5
+
+log = logging.getLogger("dlab.synthetic")
+
+# silent interval (s) at the start and end of each oeaudio entry
+lead = 2.0
+# the waveform of a sync click
+click = np.array([2000, 8000, 5000, 1000, 300], dtype="int16")
+# the waveform of a spike in the neural channels
+spike = np.rint(
+    -150 * np.exp(-0.5 * ((np.arange(30) - 8) / 2.0) ** 2)
+    + 60 * np.exp(-0.5 * ((np.arange(30) - 16) / 4.0) ** 2)
+).astype("int16")
+
+
+def click_track(start, stop, clicks, rng, noise=0.5):
+    """Returns samples [start, stop) of a sync track
+
+    clicks: the (sorted) sample indices of the clicks in the whole track
+    noise: the standard deviation of the background noise. This should be small
+           compared to the click, because the detection threshold is scaled by
+           the standard deviation of the signal.
+    """
+    data = np.rint(rng.standard_normal(stop - start, dtype="f4") * noise).astype("int16")
+    first, last = clicks.searchsorted([start - click.size + 1, stop])
+    for idx in clicks[first:last]:
+        lo = max(idx, start)
+        hi = min(idx + click.size, stop)
+        data[lo - start:hi - start] += click[lo - idx:hi - idx]
+    return data
+
+
+def neural_chunk(n_samples, rng, sampling_rate, noise=20.0, spike_rate=10.0):
+    """Returns a block of a synthetic neural channel with Gaussian noise and spikes
+
+    Spikes occur as a Poisson process with rate `spike_rate` (Hz). Spikes that
+    would extend past the end of the block are dropped.
+    """
+    data = rng.standard_normal(n_samples, dtype="f4") * noise
+    n_spikes = rng.poisson(spike_rate * n_samples / sampling_rate)
+    if n_samples > spike.size and n_spikes > 0:
+        times = rng.integers(0, n_samples - spike.size, n_spikes)
+        for i, value in enumerate(spike):
+            np.add.at(data, times + i, value)
+    return np.rint(data).astype("int16")
+
+
+def _write_entry(
+    entry, n_samples, clicks, sync_dset, n_channels, sampling_rate, offset, chunk_size, rng,
+    compression,
+):
+    """Writes the sync track and neural channels of an entry, one block at a time"""
+    attrs = {"sampling_rate": sampling_rate, "offset": offset, "units": ""}
+    names = ["CH%d" % (i + 1) for i in range(n_channels)]
+    if sync_dset is not None:
+        names.insert(0, sync_dset)
+    datasets = [
+        entry.create_dataset(name, shape=(n_samples,), dtype="int16", compression=compression)
+        for name in names
+    ]
+    for dset in datasets:
+        dset.attrs.update(attrs)
+    for start in range(0, n_samples, chunk_size):
+        stop = min(start + chunk_size, n_samples)
+        for i, dset in enumerate(datasets):
+            if i == 0 and sync_dset is not None:
+                dset[start:stop] = click_track(start, stop, clicks, rng)
+            else:
+                dset[start:stop] = neural_chunk(stop - start, rng, sampling_rate)
+
+
+def write_oeaudio(
+    path,
+    n_entries=1,
+    n_trials=100,
+    n_channels=32,
+    trial_duration=2.0,
+    stim_duration=1.0,
+    jitter=0.5,
+    max_lag=0.05,
+    sampling_rate=30000,
+    sync_dset="sync",
+    offset=0.5,
+    n_stims=10,
+    chunk_size=1 << 20,
+    compression=None,
+    seed=None,
+):
+    """Writes an ARF file with the layout of an oeaudio-present recording
+
+    Each entry has a sync track (`sync_dset`) with a click after the start of
+    each stimulus, `n_channels` neural channels, and a `Network_Events-*_TEXT`
+    table with a metadata message followed by start and stop messages for
+    each stimulus. The times in the table are offset by `offset` seconds from
+    the samples in the datasets, as in open-ephys recordings.
+
+    n_trials: the number of stimulus presentations in each entry
+    trial_duration: the minimum interval between stimulus onsets (s)
+    stim_duration: the interval between the start and stop messages (s)
+    jitter: the maximum random interval (s) added to each trial_duration
+    max_lag: the maximum lag between the start message and the sync click (s)
+
+    Returns a list with one dict per entry, with the name of the entry and the
+    sample indices of the start messages ("start") and the first samples of
+    the sync clicks ("click") in the coordinates of the datasets. Note that the
+    click detector reports the peak of each click, which is one sample later.
+    """
+    import arf
+
+    rng = np.random.default_rng(seed)
+    lead_samples = int(lead * sampling_rate)
+    sample_offset = int(offset * sampling_rate)
+    schedule = []
+    with h5.File(path, "w") as fp:
+        entry_time = 0.0
+        for entry_num in range(n_entries):
+            intervals = trial_duration + rng.uniform(0, jitter, n_trials)
+            onsets = np.concatenate([[0.0], np.cumsum(intervals[:-1])])
+            starts = lead_samples + np.rint(onsets * sampling_rate).astype("i8")
+            clicks = starts + rng.integers(
+                int(0.001 * sampling_rate), int(max_lag * sampling_rate) + 2, n_trials
+            )
+            n_samples = int(starts[-1] + intervals[-1] * sampling_rate) + lead_samples
+            name = "entry_%03d" % entry_num
+            entry = arf.create_entry(fp, name, 1e9 + entry_time)
+            log.info("- entry '%s': %d trials, %d samples", name, n_trials, n_samples)
+
+            stims = rng.integers(0, n_stims, n_trials)
+            rows = [(sample_offset, b'metadata: {"animal": "synthetic", "entry": %d}' % entry_num)]
+            for start, stim in zip(starts, stims):
+                stim_path = b"/stimuli/stim%03d.wav" % stim
+                rows.append((sample_offset + start, b"start " + stim_path))
+                stop = start + int(stim_duration * sampling_rate)
+                rows.append((sample_offset + stop, b"stop " + stim_path))
+            width = max(len(message) for _, message in rows)
+            table = np.array(rows, dtype=[("start", "<i8"), ("message", "S%d" % width)])
+            stim_log = entry.create_dataset("Network_Events-104.0_TEXT", data=table)
+            stim_log.attrs["sampling_rate"] = sampling_rate
+
+            _write_entry(
+                entry, n_samples, clicks, sync_dset, n_channels, sampling_rate, offset, chunk_size,
+                rng, compression,
+            )
+            schedule.append({"entry": name, "start": starts, "click": clicks})
+            entry_time += n_samples / sampling_rate + 60.0
+    return schedule
+
+
+def write_audiolog(
+    path,
+    n_trials=100,
+    n_channels=32,
+    trial_duration=2.0,
+    jitter=0.5,
+    max_lag=0.05,
+    sampling_rate=30000,
+    sync_dset="channel37",
+    n_stims=10,
+    chunk_size=1 << 20,
+    compression=None,
+    seed=None,
+):
+    """Writes an ARF file with the layout of a present_audio recording
+
+    There is one entry (`rec_<n>`) for each trial, with a sync track containing
+    a single click and `n_channels` neural channels. The duration of each
+    entry is trial_duration plus a random interval of up to `jitter` seconds.
+
+    Returns the "presentation" field of the corresponding present_audio log,
+    for use with `dlab.extracellular.audiolog_to_trials`.
+    """
+    import arf
+
+    rng = np.random.default_rng(seed)
+    presentation = {}
+    with h5.File(path, "w") as fp:
+        entry_time = 0.0
+        for i in range(n_trials):
+            n_samples = int((trial_duration + rng.uniform(0, jitter)) * sampling_rate)
+            lag = rng.integers(int(0.001 * sampling_rate), int(max_lag * sampling_rate) + 2)
+            clicks = np.asarray([lag])
+            entry = arf.create_entry(fp, "rec_%d" % i, 1e9 + entry_time)
+            _write_entry(
+                entry, n_samples, clicks, sync_dset, n_channels, sampling_rate, 0.0, chunk_size,
+                rng, compression,
+            )
+            presentation[str(i)] = {"stim": "stim%03d" % rng.integers(0, n_stims)}
+            entry_time += n_samples / sampling_rate
+    return presentation
+
+
+def synth_recording_script(argv=None):
+    """ CLI to generate synthetic recordings """
+    import argparse
+    from dlab.util import setup_log
+    __version__ = "0.1.0"
+
+    p = argparse.ArgumentParser(
+        description="generate a synthetic ARF recording for testing trial extraction"
+    )
+    p.add_argument(
+        "-v", "--version", action="version", version="%(prog)s " + __version__
+    )
+    p.add_argument("--debug", help="show verbose log messages", action="store_true")
+    p.add_argument(
+        "--layout",
+        choices=("oeaudio", "audiolog"),
+        default="oeaudio",
+        help="generate an oeaudio-present or present_audio recording (default %(default)s)",
+    )
+    p.add_argument(
+        "--entries",
+        type=int,
+        default=1,
+        help="number of entries (oeaudio only; default %(default)d)",
+    )
+    p.add_argument(
+        "--trials", type=int, default=100, help="number of trials per entry (default %(default)d)"
+    )
+    p.add_argument(
+        "--duration",
+        type=float,
+        help="approximate duration of each entry (s). Overrides --trials (oeaudio only)",
+    )
+    p.add_argument(
+        "--channels", type=int, default=32, help="number of neural channels (default %(default)d)"
+    )
+    p.add_argument(
+        "--trial-duration",
+        type=float,
+        default=2.0,
+        help="minimum interval between stimulus onsets (default %(default)0.1f s)",
+    )
+    p.add_argument(
+        "--jitter",
+        type=float,
+        default=0.5,
+        help="maximum random interval added to each trial (default %(default)0.1f s)",
+    )
+    p.add_argument(
+        "--max-lag",
+        type=float,
+        default=0.05,
+        help="maximum lag between the start message and the sync click (default %(default)0.2f s)",
+    )
+    p.add_argument(
+        "--sampling-rate", type=int, default=30000, help="sampling rate (default %(default)d Hz)"
+    )
+    p.add_argument(
+        "--chunk-size",
+        type=int,
+        default=1 << 20,
+        help="number of samples to generate and write at a time (default %(default)d)",
+    )
+    p.add_argument("--compression", type=int, help="gzip compression level (default none)")
+    p.add_argument("--seed", type=int, help="seed for the random number generator")
+    p.add_argument(
+        "--log",
+        type=argparse.FileType("w", encoding="utf-8"),
+        help="write the present_audio log to this file (audiolog only)",
+    )
+    p.add_argument("output", help="name of the ARF file to create")
+    args = p.parse_args(argv)
+    setup_log(log, args.debug)
+
+    common = dict(
+        n_channels=args.channels,
+        trial_duration=args.trial_duration,
+        jitter=args.jitter,
+        max_lag=args.max_lag,
+        sampling_rate=args.sampling_rate,
+        chunk_size=args.chunk_size,
+        compression=args.compression,
+        seed=args.seed,
+    )
+    if args.layout == "oeaudio":
+        n_trials = args.trials
+        if args.duration is not None:
+            interval = args.trial_duration + args.jitter / 2
+            n_trials = max(1, int((args.duration - 2 * lead) / interval))
+        write_oeaudio(args.output, n_entries=args.entries, n_trials=n_trials, **common)
+    else:
+        presentation = write_audiolog(args.output, n_trials=args.trials, **common)
+        if args.log is not None:
+            json.dump({"presentation": presentation}, args.log)
+            log.info("wrote present_audio log to '%s'", args.log.name)
+    log.info("wrote synthetic recording to '%s'", args.output)
@@ -1,5 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 # -*- mode: python -*-
-from setuptools import setup
-setup()
+import numpy
+from setuptools import setup, Extension
+
+setup(
+    ext_modules=[
+        Extension(
+            "dlab._convolve",
+            sources=["src/convolvemodule.c", "src/convolve.c"],
+            include_dirs=[numpy.get_include()],
+        ),
+        Extension(
+            "dlab._chebyshev",
+            sources=["src/chebyshev.c"],
+            include_dirs=[numpy.get_include()],
+        ),
+    ]
+)
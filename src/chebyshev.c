@@ -496,7 +496,8 @@ int fitexps(
     double *result,  /* buffer to receive fitted parameters
                         offset, amp[numexps], tau[numexps], frq[numexps] */
     char *fitt,      /* buffer to receive fitted data in double [numpoints] */
-    int fitt_stride) /* number bytes to move from one fitted value to next */
+    int fitt_stride, /* number bytes to move from one fitted value to next */
+    double *dj)      /* precalculated coefficients dj or NULL */
 {
     PyThreadState *_save = NULL;
     Py_complex xroots[MAXEXPS];
@@ -520,10 +521,14 @@ int fitexps(
     int j, t, n, N, row, col, error;
     int stride = numcoef + 1;
 
+    _save = PyEval_SaveThread();
+
     /* discrete Chebyshev coefficients dj */
     ppoly = poly;
     pcoef = coef;
-    if (data_stride == sizeof(double)) {
+    if (dj != NULL) {
+        memcpy(coef, dj, numcoef * sizeof(double));
+    } else if (data_stride == sizeof(double)) {
         double *pdata;
         for (j = 0; j < numcoef; j++) {
             pdata = (double *)data;
@@ -546,8 +551,6 @@ int fitexps(
         }
     }
 
-    _save = PyEval_SaveThread();
-
     /* integral coefficients dnj */
     N = numdata - 1;
     pdn0 = coef;
@@ -1063,6 +1066,11 @@ static PyObject* py_fitexps(PyObject *obj, PyObject *args, PyObject *kwds)
     PyArrayIterObject *data_it = NULL;
     PyArrayIterObject *fitt_it = NULL;
     PyArrayIterObject *rslt_it = NULL;
+    PyArrayIterObject *dj_it = NULL;
+    PyArrayObject *polyarr = NULL;
+    PyArrayObject *djarr = NULL;
+    PyObject *polyobj = NULL;
+    PyObject *djobj = NULL;
     Py_ssize_t newshape[NPY_MAXDIMS];
     double *poly = NULL;
     double *coef = NULL;
@@ -1072,13 +1080,15 @@ static PyObject* py_fitexps(PyObject *obj, PyObject *args, PyObject *kwds)
     int numcoef = MAXCOEF;
     int axis = NPY_MAXDIMS;
     double deltat = 1.0;
+    int withfitt = 1;
     static char *kwlist[] = {"data", "numexps", "numcoef",
-                             "deltat", "axis", NULL};
+                             "deltat", "axis", "poly", "coef", "fitted", NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O&i|idO&", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O&i|idO&OOp", kwlist,
         PyConverter_AnyDoubleArray, &data,
         &numexps, &numcoef, &deltat,
-        PyArray_AxisConverter, &axis)) return NULL;
+        PyArray_AxisConverter, &axis, &polyobj, &djobj,
+        &withfitt)) return NULL;
 
     if (axis < 0) {
         axis += PyArray_NDIM(data);
@@ -1118,11 +1128,14 @@ static PyObject* py_fitexps(PyObject *obj, PyObject *args, PyObject *kwds)
     }
 
     /* fitted data */
-    fitt = (PyArrayObject *)PyArray_SimpleNew(PyArray_NDIM(data),
-                                              PyArray_DIMS(data), NPY_DOUBLE);
-    if (fitt == NULL) {
-        PyErr_Format(PyExc_MemoryError, "unable to allocate fitt array");
-        goto _fail;
+    if (withfitt) {
+        fitt = (PyArrayObject *)PyArray_SimpleNew(PyArray_NDIM(data),
+                                                  PyArray_DIMS(data),
+                                                  NPY_DOUBLE);
+        if (fitt == NULL) {
+            PyErr_Format(PyExc_MemoryError, "unable to allocate fitt array");
+            goto _fail;
+        }
     }
 
     /* fitted parameters */
@@ -1153,24 +1166,58 @@ static PyObject* py_fitexps(PyObject *obj, PyObject *args, PyObject *kwds)
         goto _fail;
     }
 
-    /* precalculate normalized Chebyshev polynomial */
-    poly = (double *)PyMem_Malloc(numdata * (numcoef+1) * sizeof(double));
-    if (poly == NULL) {
-        PyErr_Format(PyExc_MemoryError, "unable to allocate poly");
-        goto _fail;
+    if ((polyobj != NULL) && (polyobj != Py_None)) {
+        /* use normalized Chebyshev polynomials supplied by the caller */
+        polyarr = (PyArrayObject *)PyArray_FROMANY(polyobj, NPY_DOUBLE, 2, 2,
+                                                   NPY_ARRAY_IN_ARRAY);
+        if (polyarr == NULL)
+            goto _fail;
+        if ((PyArray_DIM(polyarr, 0) < numcoef) ||
+            (PyArray_DIM(polyarr, 1) != numdata)) {
+            PyErr_Format(PyExc_ValueError, "poly has the wrong shape");
+            goto _fail;
+        }
+        poly = (double *)PyArray_DATA(polyarr);
+    } else {
+        /* precalculate normalized Chebyshev polynomial */
+        poly = (double *)PyMem_Malloc(numdata * (numcoef+1) * sizeof(double));
+        if (poly == NULL) {
+            PyErr_Format(PyExc_MemoryError, "unable to allocate poly");
+            goto _fail;
+        }
+
+        error = chebypoly(numdata, numcoef, poly, 1);
+        if (error != 0) {
+            PyErr_Format(PyExc_ValueError,
+                "chebypoly() failed with error code %i", error);
+            goto _fail;
+        }
     }
 
-    error = chebypoly(numdata, numcoef, poly, 1);
-    if (error != 0) {
-        PyErr_Format(PyExc_ValueError,
-            "chebypoly() failed with error code %i", error);
-        goto _fail;
+    if ((djobj != NULL) && (djobj != Py_None)) {
+        /* use coefficients dj supplied by the caller */
+        djarr = (PyArrayObject *)PyArray_FROMANY(djobj, NPY_DOUBLE, 0, 0,
+                                                 NPY_ARRAY_IN_ARRAY);
+        if (djarr == NULL)
+            goto _fail;
+        error = (PyArray_NDIM(djarr) != PyArray_NDIM(data)) ||
+                (PyArray_DIM(djarr, lastaxis) < numcoef);
+        for (i = 0; i < lastaxis && !error; i++) {
+            error = PyArray_DIM(djarr, i) != newshape[i];
+        }
+        if (error) {
+            PyErr_Format(PyExc_ValueError, "coef has the wrong shape");
+            goto _fail;
+        }
+        dj_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
+                                            (PyObject *)djarr, &lastaxis);
     }
 
     /* iterate over all but specified axis */
     data_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
                                             (PyObject *)data, &axis);
-    fitt_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
+    if (fitt != NULL)
+        fitt_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
                                             (PyObject *)fitt, &axis);
     rslt_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
                                             (PyObject *)rslt, &lastaxis);
@@ -1188,8 +1235,9 @@ static PyObject* py_fitexps(PyObject *obj, PyObject *args, PyObject *kwds)
             startcoef,
             buff,
             (double *)rslt_it->dataptr,
-            (char *)fitt_it->dataptr,
-            (int)PyArray_STRIDE(fitt, axis));
+            (fitt_it != NULL) ? (char *)fitt_it->dataptr : NULL,
+            (fitt != NULL) ? (int)PyArray_STRIDE(fitt, axis) : 0,
+            (dj_it != NULL) ? (double *)dj_it->dataptr : NULL);
 
         if (error != 0) {
             PyErr_Format(PyExc_ValueError,
@@ -1198,28 +1246,43 @@ static PyObject* py_fitexps(PyObject *obj, PyObject *args, PyObject *kwds)
         }
 
         PyArray_ITER_NEXT(data_it);
-        PyArray_ITER_NEXT(fitt_it);
+        if (fitt_it != NULL)
+            PyArray_ITER_NEXT(fitt_it);
         PyArray_ITER_NEXT(rslt_it);
+        if (dj_it != NULL)
+            PyArray_ITER_NEXT(dj_it);
     }
 
     Py_XDECREF(data_it);
     Py_XDECREF(fitt_it);
     Py_XDECREF(rslt_it);
+    Py_XDECREF(dj_it);
     Py_XDECREF(data);
-    PyMem_Free(poly);
+    Py_XDECREF(djarr);
+    if (polyarr != NULL)
+        Py_DECREF(polyarr);
+    else
+        PyMem_Free(poly);
     PyMem_Free(coef);
     PyMem_Free(buff);
 
+    if (fitt == NULL)
+        return Py_BuildValue("(N, O)", rslt, Py_None);
     return Py_BuildValue("(N, N)", rslt, fitt);
 
   _fail:
     Py_XDECREF(data_it);
     Py_XDECREF(fitt_it);
     Py_XDECREF(rslt_it);
+    Py_XDECREF(dj_it);
     Py_XDECREF(data);
     Py_XDECREF(fitt);
     Py_XDECREF(rslt);
-    PyMem_Free(poly);
+    Py_XDECREF(djarr);
+    if (polyarr != NULL)
+        Py_DECREF(polyarr);
+    else
+        PyMem_Free(poly);
     PyMem_Free(coef);
     PyMem_Free(buff);
 
@@ -1250,12 +1313,13 @@ static PyObject* py_fitexpsin(PyObject *obj, PyObject *args, PyObject *kwds)
     int numcoef = MAXCOEF;
     int axis = NPY_MAXDIMS;
     double deltat = 1.0;
+    int withfitt = 1;
     static char *kwlist[] = {"data", "numcoef",
-                             "deltat", "axis", NULL};
+                             "deltat", "axis", "fitted", NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O&|idO&", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O&|idO&p", kwlist,
         PyConverter_AnyDoubleArray, &data, &numcoef, &deltat,
-        PyArray_AxisConverter, &axis)) return NULL;
+        PyArray_AxisConverter, &axis, &withfitt)) return NULL;
 
     if (axis < 0) {
         axis += PyArray_NDIM(data);
@@ -1290,11 +1354,14 @@ static PyObject* py_fitexpsin(PyObject *obj, PyObject *args, PyObject *kwds)
     }
 
     /* fitted data */
-    fitt = (PyArrayObject *)PyArray_SimpleNew(PyArray_NDIM(data),
-                                              PyArray_DIMS(data), NPY_DOUBLE);
-    if (fitt == NULL) {
-        PyErr_Format(PyExc_MemoryError, "unable to allocate fitt array");
-        goto _fail;
+    if (withfitt) {
+        fitt = (PyArrayObject *)PyArray_SimpleNew(PyArray_NDIM(data),
+                                                  PyArray_DIMS(data),
+                                                  NPY_DOUBLE);
+        if (fitt == NULL) {
+            PyErr_Format(PyExc_MemoryError, "unable to allocate fitt array");
+            goto _fail;
+        }
     }
 
     /* fitted parameters */
@@ -1342,7 +1409,8 @@ static PyObject* py_fitexpsin(PyObject *obj, PyObject *args, PyObject *kwds)
     /* iterate over all but specified axis */
     data_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
                                             (PyObject *)data, &axis);
-    fitt_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
+    if (fitt != NULL)
+        fitt_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
                                             (PyObject *)fitt, &axis);
     rslt_it = (PyArrayIterObject *)PyArray_IterAllButAxis(
                                             (PyObject *)rslt, &lastaxis);
@@ -1359,8 +1427,8 @@ static PyObject* py_fitexpsin(PyObject *obj, PyObject *args, PyObject *kwds)
             startcoef,
             buff,
             (double *)rslt_it->dataptr,
-            (char *)fitt_it->dataptr,
-            (int)PyArray_STRIDE(fitt, axis));
+            (fitt_it != NULL) ? (char *)fitt_it->dataptr : NULL,
+            (fitt != NULL) ? (int)PyArray_STRIDE(fitt, axis) : 0);
 
         if (error != 0) {
             PyErr_Format(PyExc_ValueError,
@@ -1369,7 +1437,8 @@ static PyObject* py_fitexpsin(PyObject *obj, PyObject *args, PyObject *kwds)
         }
 
         PyArray_ITER_NEXT(data_it);
-        PyArray_ITER_NEXT(fitt_it);
+        if (fitt_it != NULL)
+            PyArray_ITER_NEXT(fitt_it);
         PyArray_ITER_NEXT(rslt_it);
     }
 
@@ -1381,6 +1450,8 @@ static PyObject* py_fitexpsin(PyObject *obj, PyObject *args, PyObject *kwds)
     PyMem_Free(coef);
     PyMem_Free(buff);
 
+    if (fitt == NULL)
+        return Py_BuildValue("(N, O)", rslt, Py_None);
     return Py_BuildValue("(N, N)", rslt, fitt);
 
   _fail:
@@ -1520,7 +1591,7 @@ char py_chebypoly_doc[] =
 
 static PyObject* py_chebypoly(PyObject *obj, PyObject *args, PyObject *kwds)
 {
-    PyObject *boolobj;
+    PyObject *boolobj = NULL;
     PyArrayObject *poly = NULL;
     int numcoef, numdata, error;
     int norm = 0;
@@ -3,6 +3,7 @@
  * Functions for computing convolutions
  */
 #include <math.h>
+#include <stdint.h>
 
 void
 discreteconv(const double *times, int ntimes, const double *kern, int nkern,
@@ -51,3 +52,26 @@ discreteconv(const double *times, int ntimes, const double *kern, int nkern,
             }
     }
 }
+
+/*
+ * Convolves a batch of spike trains with the same kernel. The events for train
+ * i are events[offsets[i]:offsets[i+1]], and the output for train i is written
+ * to out + i * ostride, which must have room for ceil((offset - onset) / odt)
+ * values. Each output row is zeroed before the convolution.
+ */
+void
+discreteconv_batch(const double *events, const int64_t *offsets, int ntrains,
+                   const double *kern, int nkern, double kdt, double onset,
+                   double offset, double odt, double *out, int64_t ostride)
+{
+        int i, j;
+        int NT = (int)ceil((offset - onset) / odt);
+
+        for (i = 0; i < ntrains; i++) {
+                double *row = out + i * ostride;
+                for (j = 0; j < NT; j++)
+                        row[j] = 0.0;
+                discreteconv(events + offsets[i], (int)(offsets[i+1] - offsets[i]),
+                             kern, nkern, kdt, onset, offset, odt, row);
+        }
+}
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import h5py as h5
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from dlab.chebyshev import ExponentialFitter, fit_exponentials, fit_harmonic_decay, fit_windows
+
+
+def test_fit_harmonic_decay_fields():
+    n, dt = 1000, 1e-3
+    t = np.arange(n) * dt
+    w = 2 * np.pi / (n * dt)
+    data = 1 + np.exp(-t / 0.1) * (2 + 0.5 * np.cos(w * t) - 0.3 * np.sin(w * t))
+    params, fitted = fit_harmonic_decay(data, n_coef=12, dt=dt)
+    assert params.dtype.names == ("offset", "lifetime", "amplitude")
+    np.testing.assert_allclose(params["offset"], 1.0, rtol=1e-6)
+    np.testing.assert_allclose(params["lifetime"], 0.1, rtol=1e-6)
+    np.testing.assert_allclose(params["amplitude"], [2.0, 0.3, 0.5], rtol=1e-6)
+    np.testing.assert_allclose(fitted, data, atol=1e-8)
+
+
+def test_fit_harmonic_decay_batch():
+    n, dt = 500, 1e-3
+    t = np.arange(n) * dt
+    w = 2 * np.pi / (n * dt)
+    lifetimes = np.array([0.05, 0.1, 0.2])
+    data = 0.5 + np.exp(-t / lifetimes[:, np.newaxis]) * (1 + 0.2 * np.cos(w * t))
+    params, fitted = fit_harmonic_decay(data.T, n_coef=12, dt=dt, axis=0, fitted=False)
+    assert fitted is None
+    assert params.shape == (3,)
+    np.testing.assert_allclose(params["lifetime"], lifetimes, rtol=1e-6)
+    np.testing.assert_allclose(params["amplitude"][:, 2], 0.2, rtol=1e-5)
+
+
+def test_exponential_fitter_converted_input():
+    t = np.arange(500) * 1e-4
+    data = np.stack([1 + 2 * np.exp(-t / 0.01) + np.exp(-t / 0.002)] * 2).astype("f4")
+    fitter = ExponentialFitter(n_coef=12, dt=1e-4)
+    results = [fitter.fit(data, n_exps) for n_exps in (1, 2, 2)]
+    assert len(fitter._transforms) == 1
+    expected, _ = fit_exponentials(data.astype("d"), 2, n_coef=12, dt=1e-4)
+    np.testing.assert_allclose(results[2][0]["lifetime"], expected["lifetime"])
+    np.testing.assert_allclose(results[2][0]["lifetime"][0], [0.01, 0.002], rtol=1e-3)
+
+
+def _decays(n_samples, period, dt):
+    """A train of exponential decays, restarting every `period` samples"""
+    t = (np.arange(n_samples) % period) * dt
+    return 0.5 + np.exp(-t / 0.005)
+
+
+@pytest.mark.parametrize("chunk_size, jobs", [(1 << 20, 1), (700, 1), (700, 3)])
+def test_fit_windows_matches_whole_array(chunk_size, jobs):
+    dt, window, step = 1e-4, 200, 150
+    data = _decays(5000, 300, dt)
+    expected, _ = fit_exponentials(sliding_window_view(data, window)[::step], 1, n_coef=8, dt=dt)
+    tables = list(fit_windows(data, window, step, 1, n_coef=8, dt=dt, chunk_size=chunk_size, jobs=jobs))
+    result = np.concatenate(tables)
+    assert result.dtype.names == ("start", "offset", "amplitude", "lifetime")
+    np.testing.assert_array_equal(result["start"], np.arange(result.size) * step)
+    assert result["start"][-1] + window <= data.size < result["start"][-1] + window + step
+    for name in ("offset", "amplitude", "lifetime"):
+        np.testing.assert_allclose(result[name], expected[name], rtol=1e-12, atol=1e-12)
+    # windows that start at the beginning of a decay recover its parameters
+    aligned = result["start"] % 300 == 0
+    np.testing.assert_allclose(result["lifetime"][aligned], 0.005, rtol=1e-4)
+    np.testing.assert_allclose(result["offset"][aligned], 0.5, rtol=1e-4)
+
+
+def test_fit_windows_dataset_sampling_rate(tmp_path):
+    data = _decays(3000, 400, 1e-4)
+    with h5.File(tmp_path / "data.h5", "w") as fp:
+        dset = fp.create_dataset("trace", data=data)
+        dset.attrs["sampling_rate"] = 10000
+        result = np.concatenate(list(fit_windows(dset, 400, 400, 1, n_coef=8, chunk_size=1000)))
+    assert result.size == 7
+    np.testing.assert_allclose(result["lifetime"][:, 0], 0.005, rtol=1e-4)
+    np.testing.assert_allclose(result["amplitude"][:, 0], 1.0, rtol=1e-4)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import numpy as np
+import pytest
+
+from dlab import convolve
+
+
+def _trains(n_trains, rate, duration, seed):
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(rate * duration, n_trains)
+    offsets = np.zeros(n_trains + 1, dtype="i8")
+    np.cumsum(counts, out=offsets[1:])
+    # include some events outside the output grid
+    events = np.concatenate([np.sort(rng.uniform(-0.1, duration + 0.1, n)) for n in counts])
+    return events, offsets
+
+
+def _kernel(kdt, tau=0.02, length=0.1):
+    t = np.arange(0, length, kdt)
+    return t / tau * np.exp(1 - t / tau)
+
+
+@pytest.mark.parametrize("kdt, odt", [(0.001, 0.001), (0.002, 0.001), (0.001, 0.0025), (0.0007, 0.0013)])
+def test_fft_within_tolerance(kdt, odt):
+    events, offsets = _trains(6, 40, 1.0, seed=1)
+    kernel = _kernel(kdt)
+    args = (events, offsets, kernel, kdt, 0.0, 1.0, odt)
+    direct = convolve.discreteconv_batch(*args, method="direct")
+    fft = convolve.discreteconv_batch(*args, method="fft")
+    r = odt / kdt
+    # the documented bound for each event, times the largest number of events
+    # that fall within the span of the kernel
+    per_event = np.abs(np.diff(np.append(kernel, [0, 0]), 2)).max() * r * np.ceil(r) / 4
+    span = (kernel.size + 1) * kdt + odt
+    max_events = max(
+        (train.searchsorted(train + span) - np.arange(train.size)).max(initial=0)
+        for train in np.split(events, offsets[1:-1])
+    )
+    atol = per_event * max_events + 1e-12 * np.abs(direct).max()
+    np.testing.assert_allclose(fft, direct, rtol=0, atol=atol)
+    if kdt / odt == round(kdt / odt):
+        np.testing.assert_allclose(fft, direct, rtol=0, atol=1e-12 * np.abs(direct).max())
+
+
+def test_single_train_methods_agree():
+    events, offsets = _trains(1, 40, 1.0, seed=2)
+    kernel = _kernel(0.001)
+    direct = convolve.discreteconv(events, kernel, 0.001, 0.0, 1.0, 0.001, method="direct")
+    for method in ("fft", "auto"):
+        result = convolve.discreteconv(events, kernel, 0.001, 0.0, 1.0, 0.001, method=method)
+        np.testing.assert_allclose(result, direct, rtol=0, atol=1e-12 * np.abs(direct).max())
+
+
+@pytest.mark.parametrize("method", ["direct", "fft"])
+def test_jobs_match_serial(method):
+    events, offsets = _trains(13, 30, 0.5, seed=3)
+    kernel = _kernel(0.001)
+    args = (events, offsets, kernel, 0.001, 0.0, 0.5, 0.001)
+    serial = convolve.discreteconv_batch(*args, method=method)
+    out = np.full_like(serial, np.nan)
+    parallel = convolve.discreteconv_batch(*args, out=out, jobs=4, method=method)
+    assert parallel is out
+    np.testing.assert_array_equal(parallel, serial)
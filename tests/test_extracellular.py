@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import h5py as h5
+
+from dlab import extracellular, synthetic
+
+
+def test_audiolog_to_trials_jobs(tmp_path):
+    path = tmp_path / "audiolog.arf"
+    presentation = synthetic.write_audiolog(path, n_trials=12, n_channels=0, seed=5)
+    with h5.File(path, "r") as fp:
+        serial = list(extracellular.audiolog_to_trials(presentation, fp, sync_thresh=30.0))
+        parallel = list(
+            extracellular.audiolog_to_trials(presentation, fp, sync_thresh=30.0, jobs=3)
+        )
+    assert [trial["index"] for trial in parallel] == list(range(12))
+    assert parallel == serial
+    assert all("stim_on" in trial for trial in serial)
+
+
+def test_oeaudio_to_trials_no_messages(tmp_path):
+    path = tmp_path / "oeaudio.arf"
+    synthetic.write_oeaudio(path, n_trials=3, n_channels=0, seed=1)
+    with h5.File(path, "a") as fp:
+        entry = fp["entry_000"]
+        stims = entry["Network_Events-104.0_TEXT"]
+        dtype, sampling_rate = stims.dtype, stims.attrs["sampling_rate"]
+        del entry["Network_Events-104.0_TEXT"]
+        empty = entry.create_dataset("Network_Events-104.0_TEXT", shape=(0,), dtype=dtype)
+        empty.attrs["sampling_rate"] = sampling_rate
+    with h5.File(path, "r") as fp:
+        entries = extracellular.scan_entries(fp)
+        assert entries[0]["stim_log"]["time"].size == 0
+        assert list(extracellular.oeaudio_to_trials(fp, entries=entries)) == []
+        assert list(extracellular.oeaudio_to_trials(fp, "sync", sync_thresh=30.0)) == []
+        assert list(extracellular.entry_metadata(fp, entries)) == []
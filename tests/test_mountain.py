@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import numpy as np
+
+from dlab import mountain, pprox
+
+
+def _trials(n_trials, rng):
+    return [
+        {
+            "events": sorted(rng.random(2).tolist()) if i % 3 == 0 else [],
+            "index": i,
+            "recording": {"entry": 0, "start": i * 3000, "stop": (i + 1) * 3000, "sampling_rate": 1000},
+        }
+        for i in range(n_trials)
+    ]
+
+
+def test_assign_event_chunks_array_pprox():
+    rng = np.random.default_rng(0)
+    obj = pprox.from_trials(_trials(20, rng))
+    times = np.sort(rng.integers(0, 20 * 3000, 2000))
+    clusters = rng.integers(0, 5, times.size)
+    events = np.column_stack([clusters % 2, times, clusters])
+    chunks = (events[:700], events[700:])
+    expected = mountain.assign_event_chunks(obj, chunks)
+    result = mountain.assign_event_chunks(pprox.ArrayPprox.from_pprox(obj), chunks)
+    assert list(result) == list(expected)
+    for clust_id, cluster in result.items():
+        assert isinstance(cluster, pprox.ArrayPprox)
+        assert cluster["cluster"] == clust_id
+        assert cluster["channel"] == expected[clust_id]["channel"]
+        assert cluster.to_pprox()["pprox"] == expected[clust_id]["pprox"]
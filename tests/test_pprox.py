@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import json
+import os
+
+import numpy as np
+import pytest
+
+from dlab import mountain, pprox
+
+
+@pytest.fixture
+def document(tmp_path):
+    obj = {
+        "$schema": "https://meliza.org/spec:2/pprox.json#",
+        "cluster": 12.5,
+        "channel": 3,
+        "gain": 1e-05,
+        "sorted": True,
+        "pprox": [
+            {
+                "index": i,
+                "offset": 1234.5678 * i,
+                "events": [0.1 * j - 1.25e-3 for j in range(i)],
+                "stim": "stim%d" % (i % 3),
+                "recording": {"entry": i // 4, "start": 30000 * i, "stop": 30000 * i + 60000},
+            }
+            for i in range(10)
+        ],
+        "recording": -0.5,
+        "entry_count": 3,
+    }
+    path = tmp_path / "unit.pprox"
+    with open(path, "wt") as fp:
+        json.dump(obj, fp, indent=1)
+    return path, obj
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 64))
+def test_stream_chunk_sizes(document, chunk_size):
+    path, obj = document
+    streamed = pprox.stream(path, chunk_size)
+    for key, value in obj.items():
+        if key != "pprox":
+            assert streamed[key] == value
+    assert list(streamed["pprox"]) == obj["pprox"]
+
+
+def test_array_pprox_numpy_scalars():
+    trials = [
+        {
+            "events": [0.1 * i, 0.2 * i],
+            "offset": np.float64(2.5 * i),
+            "recording": {"entry": 0, "start": np.int64(30000 * i), "sampling_rate": 30000},
+        }
+        for i in range(4)
+    ]
+    obj = pprox.ArrayPprox.from_pprox(pprox.from_trials(trials))
+    assert obj.columns["offset"].dtype == np.float64
+    assert obj.columns["recording.start"].dtype == np.int64
+    for use_recording in (False, True):
+        np.testing.assert_array_equal(
+            mountain.aggregate_events(obj, use_recording=use_recording),
+            mountain.aggregate_events(pprox.from_trials(trials), use_recording=use_recording),
+        )
+
+
+def test_array_pprox_mixed_bool():
+    obj = pprox.ArrayPprox.from_pprox({"pprox": [{"events": [], "flag": True}, {"events": [], "flag": 1}]})
+    assert obj.columns["flag"].dtype == object
+
+
+@pytest.mark.parametrize(
+    "trials",
+    [
+        [{"events": [0.1], "offset": np.float64(1.0)}, {"events": []}],
+        [{"events": [], "recording": {"start": np.int64(10), "stop": 20}}, {"events": []}],
+    ],
+)
+def test_check_structure_forms_agree(trials):
+    obj = pprox.from_trials(trials)
+    pprox.check_structure(obj)
+    pprox.check_structure(pprox.ArrayPprox.from_pprox(obj))
+
+
+def test_check_structure_rejects_bad_offset():
+    obj = pprox.from_trials([{"events": [], "offset": 1.0}, {"events": [], "offset": "x"}])
+    with pytest.raises(ValueError):
+        pprox.check_structure(obj)
+    with pytest.raises(ValueError):
+        pprox.check_structure(pprox.ArrayPprox.from_pprox(obj))
+
+
+def test_dataset_index_trial_order(tmp_path):
+    from dlab.mountain import write_pprox
+
+    trials = [{"events": [0.1 * i], "index": i, "stim": "stim%d" % (i % 2)} for i in range(5)]
+    obj = pprox.from_trials(trials, cluster=1)
+    json_path = str(tmp_path / "unit.pprox")
+    binary_path = str(tmp_path / "unit.ppxb")
+    write_pprox(obj, json_path)
+    pprox.write_binary(pprox.ArrayPprox.from_pprox(obj), binary_path)
+    index = pprox.DatasetIndex()
+    index.update([json_path, binary_path])
+    for path in (json_path, binary_path):
+        found = [trial["index"] for p, trial in index.trials(stim=lambda s: True) if p == path]
+        assert found == [0, 1, 2, 3, 4]
+        found = [trial["index"] for p, trial in index.trials(stim="stim0") if p == path]
+        assert found == [0, 2, 4]
+
+
+def test_index_cache_retention():
+    import gc
+    import weakref
+
+    class Trial(dict):
+        pass
+
+    trial = Trial(events=[], stim="a")
+    ref = weakref.ref(trial)
+    obj = pprox.from_trials([trial])
+    assert list(pprox.index_trials(obj, "stim")) == ["a"]
+    del trial, obj
+    for i in range(pprox._index_cache_size):
+        pprox.index_trials(pprox.from_trials([{"events": [], "stim": i}]), "stim")
+    gc.collect()
+    assert ref() is None
+    pprox.clear_index_cache()
+    assert not pprox._index_cache
+
+
+def test_write_binary_over_mapped_file(tmp_path):
+    path = str(tmp_path / "unit.ppxb")
+    trials = [{"events": [0.1 * j for j in range(i)], "stim": "s%d" % i} for i in range(200)]
+    pprox.write_binary(pprox.from_trials(trials, cluster=1), path)
+    obj = pprox.read_binary(path)
+    obj.metadata["cluster"] = 2
+    pprox.write_binary(obj, path)
+    assert os.listdir(tmp_path) == ["unit.ppxb"]
+    reloaded = pprox.read_binary(path)
+    assert reloaded["cluster"] == 2
+    assert reloaded.to_pprox()["pprox"] == tuple(trials)
+    # the original mapping is still readable
+    assert obj.to_pprox()["pprox"] == tuple(trials)
+
+
+def test_array_pprox_dotted_keys():
+    trials = [
+        {"events": [0.5], "a.b": 1, "a": {"b": 2, "c.d": "x", "e\\f": 3.0}},
+        {"events": [], "a.b": 4, "a": {"b": 5, "c.d": "y", "e\\f": 6.0}},
+    ]
+    obj = pprox.ArrayPprox.from_pprox(pprox.from_trials(trials))
+    assert obj.columns["a.b"].tolist() == [2, 5]
+    assert obj.to_pprox()["pprox"] == tuple(trials)
+
+
+def test_groupby_order_with_missing():
+    trials = [
+        {"events": [], "stim": "b", "level": 2},
+        {"events": [], "level": 1},
+        {"events": [], "stim": "a", "level": 2},
+        {"events": [], "stim": "b", "level": 1},
+        {"events": [], "stim": 3, "level": 1},
+    ]
+    for obj in (pprox.from_trials(trials), pprox.ArrayPprox.from_pprox(pprox.from_trials(trials))):
+        groups = [(value, len(group)) for value, group in pprox.groupby(obj, "stim")]
+        assert groups == [(3, 1), ("a", 1), ("b", 2), (pprox.MISSING, 1)]
+        values = [value for value, _ in pprox.groupby(obj, "stim", "level")]
+        assert values == [(3, 1), ("a", 2), ("b", 1), ("b", 2), (pprox.MISSING, 1)]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_binary_round_trip(tmp_path, mmap):
+    trials = [
+        {
+            "events": [0.01 * j for j in range(i % 4)],
+            "index": i,
+            "stim": "stim%d" % (i % 3),
+            "offset": 1.5 * i,
+            "recording": {"entry": 0, "start": 100 * i, "stop": 100 * (i + 1), "sampling_rate": 1000},
+            "extra": {"x": [1, 2]} if i % 2 else None,
+        }
+        for i in range(7)
+    ]
+    trials[3]["condition"] = "odd"
+    obj = pprox.from_trials(trials, cluster=4, channel=[1, 2])
+    path = str(tmp_path / "unit.ppxb")
+    pprox.write_binary(obj, path)
+    loaded = pprox.read_binary(path, mmap=mmap)
+    # mapped arrays are read-only views on the file
+    assert loaded.events.flags.writeable != mmap
+    assert loaded["cluster"] == 4 and loaded["channel"] == [1, 2]
+    assert loaded.to_pprox()["pprox"] == tuple(trials)
+    assert pprox.load(path, mmap=mmap).to_pprox() == loaded.to_pprox()
+
+
+def test_binary_round_trip_empty(tmp_path):
+    path = str(tmp_path / "empty.ppxb")
+    pprox.write_binary(pprox.empty(), path)
+    for mmap in (True, False):
+        loaded = pprox.read_binary(path, mmap=mmap)
+        assert len(loaded) == 0
+        assert loaded.to_pprox()["pprox"] == ()
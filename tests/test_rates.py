@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# -*- mode: python -*-
+import numpy as np
+import pytest
+
+from dlab import pprox, rates
+
+
+@pytest.mark.parametrize("kernel_size", [1, 2, 5, 6])
+def test_smooth_matches_convolve(kernel_size):
+    rng = np.random.default_rng(kernel_size)
+    data = rng.random((3, 40))
+    kernel = rng.random(kernel_size)
+    expected = np.stack([np.convolve(row, kernel, mode="same") for row in data])
+    np.testing.assert_allclose(rates.smooth(data, kernel), expected, atol=1e-12)
+    np.testing.assert_allclose(rates.smooth(data.T, kernel, axis=0), expected.T, atol=1e-12)
+
+
+def _unit(rng, n_trials):
+    trials = [{"events": np.sort(rng.uniform(-0.5, 2.5, rng.integers(0, 30))).tolist()} for _ in range(n_trials)]
+    # an event on the last bin edge is counted in the last bin
+    trials[0]["events"].append(2.0)
+    return pprox.from_trials(trials)
+
+
+def test_count_matrix_and_psth():
+    rng = np.random.default_rng(1)
+    bins = np.linspace(0, 2.0, 21)
+    obj = _unit(rng, 8)
+    expected = np.stack([np.histogram(trial["events"], bins)[0] for trial in obj["pprox"]])
+    for form in (obj, pprox.ArrayPprox.from_pprox(obj)):
+        np.testing.assert_array_equal(rates.count_matrix(form, bins), expected)
+        np.testing.assert_allclose(rates.rate(form, bins), expected / np.diff(bins))
+        np.testing.assert_allclose(rates.psth(form, bins), expected.mean(0) / np.diff(bins))
+
+
+def test_population_psth():
+    rng = np.random.default_rng(2)
+    bins = np.linspace(0, 2.0, 41)
+    units = [_unit(rng, n) for n in (3, 5, 1)]
+    expected = np.stack([rates.psth(unit, bins, bandwidth=0.05) for unit in units])
+    np.testing.assert_allclose(rates.population_psth(units, bins, bandwidth=0.05), expected)